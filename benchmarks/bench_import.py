@@ -0,0 +1,109 @@
+"""
+Startup benchmark: time `import medluma_app` and the first access to
+`medluma_app.root_agent` (which imports and builds the pipeline) in fresh
+interpreters, and report the medians.
+
+`--importtime` also lists the slowest modules from `python -X importtime`
+for the full build. `--max-import-ms` exits with status 1 when the median
+import time exceeds it, so CI can catch a heavy import creeping back into
+medluma_app.py.
+
+Usage:
+    python benchmarks/bench_import.py [--runs 5] [--importtime] [--max-import-ms 50]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import medluma_app
+imported = time.perf_counter()
+medluma_app.root_agent
+built = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "build_ms": (built - imported) * 1000,
+}))
+"""
+
+ADK_PROBE = """
+import sys
+import medluma_app
+print(int("google.adk" in sys.modules))
+"""
+
+
+def _env(scratch: str) -> dict:
+    # Keep probes off any local caches, trace log or session database
+    return {
+        **os.environ,
+        "MEDLUMA_RESEARCH_CACHE": os.path.join(scratch, "research_cache.sqlite3"),
+        "MEDLUMA_SEMANTIC_CACHE": os.path.join(scratch, "semantic_cache"),
+        "MEDLUMA_BIO_INDEX": os.path.join(scratch, "bio_index.sqlite3"),
+        "MEDLUMA_OUTPUT_STORE": os.path.join(scratch, "outputs.sqlite3"),
+        "MEDLUMA_TRACE_FILE": "",
+        "PYTHONWARNINGS": "ignore",
+    }
+
+
+def run_probe(env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: dict, top: int) -> list[tuple[int, str]]:
+    """(cumulative microseconds, module) of the slowest top-level imports."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import medluma_app; medluma_app.root_agent"],
+                            cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Top-level imports are the least indented names in the tree
+        if not name[1:].startswith(" "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(args) -> int:
+    env = _env(tempfile.mkdtemp(prefix="medluma_bench_import_"))
+    results = [run_probe(env) for _ in range(args.runs)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    build_ms = statistics.median(r["build_ms"] for r in results)
+    adk_loaded = subprocess.run([sys.executable, "-c", ADK_PROBE], cwd=REPO_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout.strip() == "1"
+
+    print(f"import medluma_app:   {import_ms:8.1f} ms (median of {args.runs})")
+    print(f"first root_agent:     {build_ms:8.1f} ms")
+    print(f"google.adk on import: {'yes' if adk_loaded else 'no'}")
+
+    if args.importtime:
+        print("\nslowest imports (cumulative):")
+        for micros, name in slowest_imports(env, args.top):
+            print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"\nFAIL: import took {import_ms:.1f} ms, over the {args.max_import_ms} ms limit")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure medluma_app import and first-build time.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument("--importtime", action="store_true", help="List the slowest imports")
+    parser.add_argument("--top", type=int, default=15, help="Modules to list with --importtime")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if the median import time exceeds this")
+    sys.exit(main(parser.parse_args()))
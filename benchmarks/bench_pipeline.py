@@ -0,0 +1,212 @@
+"""
+Offline pipeline benchmark: root_agent from medluma_app.py against a fake
+Gemini and a stub BioMCP server, for 1..N concurrent sessions.
+
+Reports throughput, per-stage latency (from the tracing plugin) and peak
+Python memory for each pipeline configuration:
+  - parallel:   the research stage as shipped (ParallelAgent)
+  - sequential: the same researchers run one after the other
+
+Usage:
+    python benchmarks/bench_pipeline.py --sessions 1 4 16 --model-latency 0.2 --tool-latency 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+# Keep benchmark runs independent of any local caches or trace log
+_scratch = tempfile.mkdtemp(prefix="medluma_bench_")
+os.environ["MEDLUMA_RESEARCH_CACHE"] = os.path.join(_scratch, "research_cache.sqlite3")
+os.environ["MEDLUMA_RESEARCH_CACHE_TTL"] = "0"
+os.environ["MEDLUMA_SEMANTIC_CACHE"] = os.path.join(_scratch, "semantic_cache")
+os.environ["MEDLUMA_SEMANTIC_CACHE_TTL"] = "0"
+os.environ["MEDLUMA_OUTPUT_STORE"] = ""
+os.environ["MEDLUMA_TRACE_FILE"] = ""
+
+warnings.filterwarnings("ignore")
+
+from google.genai import types
+from google.adk.agents import LlmAgent, SequentialAgent
+from google.adk.apps.app import App, ResumabilityConfig
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+import medluma_app
+from medluma_events import ApprovalDetector, StateCapture, process_events
+from medluma_mcp import BioMcpPool, PooledMcpToolset, ToolCallCache
+from medluma_stream import resume_message
+from medluma_tracing import TracingPlugin, percentile, summarize
+
+from fake_gemini import FakeGemini, load_responses
+from fake_biomcp_server import RECORDINGS
+
+
+STAGES = ["ResearchPipeline", "BioResearcher", "HealthResearcher",
+          "ArticlePipeline", "FinalOutputAgent"]
+
+
+def _walk(agent):
+    yield agent
+    for sub_agent in agent.sub_agents:
+        yield from _walk(sub_agent)
+
+
+def build_root_agent(config: str, model: FakeGemini, bio_toolset):
+    """Clone root_agent, swap in the fakes and pick the research configuration."""
+    root = medluma_app.root_agent.clone()
+    for agent in _walk(root):
+        if isinstance(agent, LlmAgent):
+            agent.model = model
+            if agent.name == "BioResearcher":
+                agent.tools = [bio_toolset]
+
+    if config == "sequential":
+        parent = next(agent for agent in _walk(root)
+                      if any(sub_agent.name == "ResearchPipeline" for sub_agent in agent.sub_agents))
+        index = next(i for i, agent in enumerate(parent.sub_agents) if agent.name == "ResearchPipeline")
+        parallel = parent.sub_agents[index]
+        sequential = SequentialAgent(
+            name=parallel.name,
+            sub_agents=[branch.clone() for branch in parallel.sub_agents],
+            before_agent_callback=parallel.before_agent_callback,
+            after_agent_callback=parallel.after_agent_callback,
+        )
+        sequential.parent_agent = parent
+        parent.sub_agents[index] = sequential
+    return root
+
+
+async def run_session(runner, session_service, index: int, preference: str):
+    """One user session: query, preference pause, resume to final output.
+
+    Returns the session's end-to-end latency, or None if it did not finish.
+    """
+    started = time.perf_counter()
+    session_id = f"bench_{index}"
+    await session_service.create_session(app_name="medluma", user_id="bench", session_id=session_id)
+    query = types.Content(role="user", parts=[types.Part(text=f"gardner syndrome advances #{index}")])
+
+    approval = ApprovalDetector()
+    captured = StateCapture("final_output")
+    await process_events(runner.run_async(user_id="bench", session_id=session_id, new_message=query), approval, captured)
+
+    if approval.approval:
+        await process_events(runner.run_async(
+            user_id="bench",
+            session_id=session_id,
+            new_message=resume_message(approval.approval["approval_id"], preference),
+            invocation_id=approval.approval["invocation_id"],
+        ), captured)
+
+    return time.perf_counter() - started if "final_output" in captured.state else None
+
+
+async def bench(config: str, sessions: int, model: FakeGemini, bio_toolset, preference: str) -> dict:
+    trace_path = os.path.join(_scratch, f"trace_{config}_{sessions}.jsonl")
+    app = App(
+        name="medluma",
+        root_agent=build_root_agent(config, model, bio_toolset),
+        plugins=[TracingPlugin(path=trace_path)],
+        resumability_config=ResumabilityConfig(is_resumable=True),
+    )
+    session_service = InMemorySessionService()
+    runner = Runner(app=app, session_service=session_service)
+
+    cache = bio_toolset.cache
+    if cache is not None:
+        cache.clear()  # each configuration starts cold
+    tracemalloc.start()
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(
+        run_session(runner, session_service, i, preference) for i in range(sessions)
+    ))
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stages = {row["stage"]: row for row in summarize(trace_path)}
+    finished = [latency for latency in latencies if latency is not None]
+    return {
+        "config": config,
+        "sessions": sessions,
+        "completed": len(finished),
+        "session_p50": round(percentile(finished, 50), 3) if finished else None,
+        "session_p95": round(percentile(finished, 95), 3) if finished else None,
+        "wall_seconds": round(wall, 3),
+        "throughput": round(sessions / wall, 3),
+        "peak_mb": round(peak / 1e6, 2),
+        "tool_cache": cache.stats() if cache is not None else None,
+        "stages": {
+            name: {"p50": round(row["p50"], 3), "p95": round(row["p95"], 3)}
+            for name, row in stages.items()
+            if name in STAGES or name.startswith("mcp:")
+        },
+    }
+
+
+def print_results(results: list[dict]):
+    print(f"\n{'config':<12} {'sessions':>8} {'done':>5} {'wall s':>8} {'sess/s':>8} "
+          f"{'sess p50':>8} {'sess p95':>8} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['config']:<12} {r['sessions']:>8} {r['completed']:>5} {r['wall_seconds']:>8.2f} "
+              f"{r['throughput']:>8.2f} {r['session_p50'] or 0:>8.2f} {r['session_p95'] or 0:>8.2f} "
+              f"{r['peak_mb']:>8.1f}")
+        if r["tool_cache"]:
+            print(f"{'':<12} tool cache: {r['tool_cache']}")
+
+    for r in results:
+        print(f"\n[{r['config']}, {r['sessions']} sessions] stage latency (p50 / p95 s)")
+        for name, row in sorted(r["stages"].items()):
+            print(f"  {name:<36} {row['p50']:>7.2f} {row['p95']:>7.2f}")
+
+
+async def main(args):
+    model = FakeGemini(latency=args.model_latency, responses=load_responses())
+    pool = BioMcpPool(
+        command=sys.executable,
+        args=[os.path.join(BENCH_DIR, "fake_biomcp_server.py"), RECORDINGS, str(args.tool_latency)],
+        size=args.pool_size,
+        max_concurrency=args.pool_concurrency,
+    )
+    await pool.start()
+    bio_toolset = PooledMcpToolset(pool=pool, cache=ToolCallCache() if args.tool_cache else None)
+
+    results = []
+    try:
+        for config in args.configs:
+            for sessions in args.sessions:
+                results.append(await bench(config, sessions, model, bio_toolset, args.preference))
+    finally:
+        await pool.close()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Medluma pipeline benchmark.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16], help="Concurrent session counts")
+    parser.add_argument("--configs", nargs="+", default=["parallel", "sequential"],
+                        choices=["parallel", "sequential"])
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Fake Gemini latency per call (s)")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="Stub BioMCP latency per call (s)")
+    parser.add_argument("--pool-size", type=int, default=2, help="Stub BioMCP server processes")
+    parser.add_argument("--pool-concurrency", type=int, default=8, help="Concurrent BioMCP calls")
+    parser.add_argument("--no-tool-cache", dest="tool_cache", action="store_false",
+                        help="Send every BioMCP call to the stub server")
+    parser.add_argument("--preference", default="simple", choices=["simple", "comprehensive"])
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
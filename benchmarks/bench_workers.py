@@ -0,0 +1,144 @@
+"""
+Worker pool benchmark: the same sessions (query, preference pause, resume)
+on 1..N worker processes, each running root_agent from medluma_app.py
+against the fake Gemini and the stub BioMCP server.
+
+Reports throughput and session latency per worker count. The fake model
+sleeps rather than computes, so the difference between worker counts is the
+orchestration, event handling and stdio work one event loop has to do.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 --sessions 64 --model-latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+warnings.filterwarnings("ignore")
+
+from medluma_tracing import percentile
+from medluma_workers import WorkerPool
+
+
+# Set by build_app() in each worker; the pool closes it when the worker stops
+bio_mcp_pool = None
+
+
+def build_app():
+    """Worker-side App: root_agent with the fake model and the stub BioMCP server."""
+    global bio_mcp_pool
+    from google.adk.agents import LlmAgent
+    from google.adk.apps.app import App, ResumabilityConfig
+
+    import medluma_app
+    from medluma_mcp import BioMcpPool, PooledMcpToolset, ToolCallCache
+    from fake_biomcp_server import RECORDINGS
+    from fake_gemini import FakeGemini, load_responses
+
+    model = FakeGemini(latency=float(os.environ["BENCH_MODEL_LATENCY"]), responses=load_responses())
+    bio_mcp_pool = BioMcpPool(
+        command=sys.executable,
+        args=[os.path.join(BENCH_DIR, "fake_biomcp_server.py"), RECORDINGS, os.environ["BENCH_TOOL_LATENCY"]],
+        size=1,
+    )
+    bio_toolset = PooledMcpToolset(pool=bio_mcp_pool, cache=ToolCallCache())
+
+    def walk(agent):
+        yield agent
+        for sub_agent in agent.sub_agents:
+            yield from walk(sub_agent)
+
+    root = medluma_app.root_agent.clone()
+    for agent in walk(root):
+        if isinstance(agent, LlmAgent):
+            agent.model = model
+            if agent.name == "BioResearcher":
+                agent.tools = [bio_toolset]
+    return App(name="medluma", root_agent=root, resumability_config=ResumabilityConfig(is_resumable=True))
+
+
+async def run_session(pool: WorkerPool, index: int, preference: str):
+    """Query, answer the preference question, and return the latency (None if unfinished)."""
+    started = time.perf_counter()
+    session_id = f"bench_{index}"
+    approval, last = None, {}
+    async for chunk in pool.run("bench", session_id, f"gardner syndrome advances #{index}"):
+        approval = chunk if chunk["type"] == "approval" else approval
+        last = chunk
+    if approval:
+        async for chunk in pool.resume("bench", session_id, approval["invocation_id"], approval["approval_id"],
+                                       preference, delete_session=True):
+            last = chunk
+    return time.perf_counter() - started if last.get("final_output") else None
+
+
+async def bench(workers: int, sessions: int, preference: str) -> dict:
+    pool = WorkerPool(workers=workers, app="bench_workers:build_app")
+    await pool.start()
+    try:
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(run_session(pool, i, preference) for i in range(sessions)))
+        wall = time.perf_counter() - started
+    finally:
+        await pool.close()
+    finished = [latency for latency in latencies if latency is not None]
+    return {
+        "workers": workers,
+        "sessions": sessions,
+        "completed": len(finished),
+        "wall_seconds": round(wall, 3),
+        "throughput": round(sessions / wall, 3),
+        "session_p50": round(percentile(finished, 50), 3) if finished else None,
+        "session_p95": round(percentile(finished, 95), 3) if finished else None,
+    }
+
+
+async def main(args):
+    # Children inherit the environment: scratch caches, in-memory sessions, no trace log
+    scratch = tempfile.mkdtemp(prefix="medluma_bench_workers_")
+    os.environ.update({
+        "MEDLUMA_RESEARCH_CACHE": os.path.join(scratch, "research_cache.sqlite3"),
+        "MEDLUMA_RESEARCH_CACHE_TTL": "0",
+        "MEDLUMA_SEMANTIC_CACHE": os.path.join(scratch, "semantic_cache"),
+        "MEDLUMA_SEMANTIC_CACHE_TTL": "0",
+        "MEDLUMA_BIO_INDEX": os.path.join(scratch, "bio_index.sqlite3"),
+        "MEDLUMA_OUTPUT_STORE": "",
+        "MEDLUMA_TRACE_FILE": "",
+        "MEDLUMA_SESSION_DB": "memory://",
+        "BENCH_MODEL_LATENCY": str(args.model_latency),
+        "BENCH_TOOL_LATENCY": str(args.tool_latency),
+        "PYTHONWARNINGS": "ignore",
+    })
+
+    results = [await bench(workers, args.sessions, args.preference) for workers in args.workers]
+    base = results[0]["throughput"]
+    print(f"\n{'workers':>7} {'sessions':>8} {'done':>5} {'wall s':>8} {'sess/s':>8} {'speedup':>8} "
+          f"{'sess p50':>8} {'sess p95':>8}")
+    for r in results:
+        print(f"{r['workers']:>7} {r['sessions']:>8} {r['completed']:>5} {r['wall_seconds']:>8.2f} "
+              f"{r['throughput']:>8.2f} {r['throughput'] / base:>7.2f}x {r['session_p50'] or 0:>8.2f} "
+              f"{r['session_p95'] or 0:>8.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Medluma worker pool benchmark.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--sessions", type=int, default=64, help="Concurrent sessions per run")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Fake Gemini latency per call (s)")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="Stub BioMCP latency per call (s)")
+    parser.add_argument("--preference", default="simple", choices=["simple", "comprehensive"])
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
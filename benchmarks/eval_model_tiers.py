@@ -0,0 +1,201 @@
+"""
+Model tier evaluation: run a fixed set of disease queries through root_agent
+from medluma_app.py under several model routing tables and compare latency,
+tokens, cost and a simple quality check against the first table.
+
+Research is stubbed: the recorded BioResearcher / HealthResearcher output is
+seeded into the research cache, so only the agents that read it (aggregator,
+writer, critic, refiner, final output) call a model. By default those calls go
+to Gemini (GOOGLE_API_KEY needed); `--fake` uses the fake model instead, with
+per-model latencies from FAKE_MODEL_LATENCY, to check the harness offline.
+
+Usage:
+    python benchmarks/eval_model_tiers.py [--tiers flash routed lite] [--fake]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+_scratch = tempfile.mkdtemp(prefix="medluma_eval_")
+os.environ["MEDLUMA_RESEARCH_CACHE"] = os.path.join(_scratch, "research_cache.sqlite3")
+os.environ["MEDLUMA_SEMANTIC_CACHE"] = os.path.join(_scratch, "semantic_cache")
+os.environ["MEDLUMA_SEMANTIC_CACHE_TTL"] = "0"
+os.environ["MEDLUMA_OUTPUT_STORE"] = ""
+os.environ["MEDLUMA_TRACE_FILE"] = ""
+
+warnings.filterwarnings("ignore")
+
+from google.genai import types
+from google.adk.agents import LlmAgent
+from google.adk.apps.app import App, ResumabilityConfig
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+import medluma_app
+from medluma_models import DEFAULT_MODEL_ROUTES, MODEL_TIERS, ModelRouter, cost, load_routes
+from medluma_tracing import TracingPlugin, percentile
+
+from fake_gemini import FakeGemini, load_responses
+
+
+QUERIES = [
+    "gardner syndrome",
+    "recent advances in gardner syndrome treatment",
+    "gardner syndrome clinical trials",
+    "desmoid tumors in gardner syndrome",
+]
+PREFERENCES = ["simple", "comprehensive"]
+COMPREHENSIVE_SECTIONS = ["BACKGROUND", "SUMMARY", "KEY DEVELOPMENTS", "REFERENCES"]
+
+# Seconds per call for --fake runs; only the ratios between tiers matter
+FAKE_MODEL_LATENCY = {
+    "gemini-2.5-flash-lite": 0.4,
+    "gemini-2.5-flash": 1.0,
+    "gemini-2.5-pro": 2.5,
+}
+
+
+def _walk(agent):
+    yield agent
+    for sub_agent in agent.sub_agents:
+        yield from _walk(sub_agent)
+
+
+def tier_routes(tier: str) -> dict:
+    """Routing table for a tier name: a uniform tier, "routed" (the shipped table) or "env"."""
+    if tier in MODEL_TIERS:
+        return {agent: tier for agent in DEFAULT_MODEL_ROUTES}
+    if tier == "routed":
+        return dict(DEFAULT_MODEL_ROUTES)
+    if tier == "env":
+        return {**DEFAULT_MODEL_ROUTES, **load_routes(os.environ.get("MEDLUMA_MODEL_ROUTES", ""))}
+    return load_routes(tier)
+
+
+def passes_quality(preference: str, final_output: str) -> bool:
+    """A cheap bar: the answer exists, and comprehensive answers have every section."""
+    if not final_output or len(final_output) < 200:
+        return False
+    if preference == "comprehensive":
+        upper = final_output.upper()
+        return all(section in upper for section in COMPREHENSIVE_SECTIONS)
+    return True
+
+
+def build_root_agent(router: ModelRouter, fake: bool, responses: dict):
+    root = medluma_app.root_agent.clone()
+    for agent in _walk(root):
+        if isinstance(agent, LlmAgent):
+            model = router.model_for(agent.name)
+            agent.model = (
+                FakeGemini(model=model, latency=FAKE_MODEL_LATENCY.get(model, 1.0), responses=responses)
+                if fake else router(agent.name)
+            )
+    return root
+
+
+async def run_query(runner, session_service, session_id: str, query: str, preference: str):
+    await session_service.create_session(app_name="medluma", user_id="eval", session_id=session_id)
+    started = time.perf_counter()
+    async for _ in runner.run_async(
+        user_id="eval",
+        session_id=session_id,
+        new_message=types.Content(role="user", parts=[types.Part(text=query)]),
+        state_delta={"user_preference": preference},
+    ):
+        pass
+    latency = time.perf_counter() - started
+    session = await session_service.get_session(app_name="medluma", user_id="eval", session_id=session_id)
+    return latency, session.state.get("final_output", "")
+
+
+def usage_by_agent(trace_path: str) -> dict:
+    usage = defaultdict(lambda: [0, 0])
+    with open(trace_path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["type"] == "agent":
+                usage[record["agent"]][0] += record["input_tokens"]
+                usage[record["agent"]][1] += record["output_tokens"]
+    return usage
+
+
+async def evaluate(tier: str, fake: bool, responses: dict) -> dict:
+    router = ModelRouter(tier_routes(tier))
+    trace_path = os.path.join(_scratch, f"trace_{tier.replace(os.sep, '_')}.jsonl")
+    app = App(
+        name="medluma",
+        root_agent=build_root_agent(router, fake, responses),
+        plugins=[TracingPlugin(path=trace_path)],
+        resumability_config=ResumabilityConfig(is_resumable=True),
+    )
+    session_service = InMemorySessionService()
+    runner = Runner(app=app, session_service=session_service)
+
+    latencies, passed = [], 0
+    for i, query in enumerate(QUERIES):
+        for preference in PREFERENCES:
+            latency, final_output = await run_query(runner, session_service, f"{tier}_{i}_{preference}",
+                                                    query, preference)
+            latencies.append(latency)
+            passed += passes_quality(preference, final_output)
+
+    usage = usage_by_agent(trace_path)
+    runs = len(latencies)
+    return {
+        "tier": tier,
+        "runs": runs,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "tokens_per_run": round(sum(sum(tokens) for tokens in usage.values()) / runs),
+        "cost_per_run": sum(cost(router.model_for(agent), *tokens) for agent, tokens in usage.items()) / runs,
+        "quality_pass_rate": round(passed / runs, 3),
+        "models": {agent: router.model_for(agent) for agent in sorted(usage) if any(usage[agent])},
+    }
+
+
+def print_results(results: list[dict]):
+    base = results[0]
+    print(f"\n{'tier':<10} {'runs':>5} {'p50 s':>7} {'p95 s':>7} {'tok/run':>8} {'$/run':>9} "
+          f"{'quality':>8} {'Δp50':>7} {'Δcost':>7}")
+    for r in results:
+        latency_delta = (r["latency_p50"] / base["latency_p50"] - 1) if base["latency_p50"] else 0
+        cost_delta = (r["cost_per_run"] / base["cost_per_run"] - 1) if base["cost_per_run"] else 0
+        print(f"{r['tier']:<10} {r['runs']:>5} {r['latency_p50']:>7.2f} {r['latency_p95']:>7.2f} "
+              f"{r['tokens_per_run']:>8} {r['cost_per_run']:>9.5f} {r['quality_pass_rate']:>8.0%} "
+              f"{latency_delta:>+7.0%} {cost_delta:>+7.0%}")
+    for r in results:
+        print(f"\n[{r['tier']}] " + ", ".join(f"{agent}={model}" for agent, model in r["models"].items()))
+
+
+async def main(args):
+    responses = load_responses()
+    # Stub research: every query is answered from the recorded researcher output
+    for query in QUERIES:
+        medluma_app.research_cache.put(query, responses["BioResearcher"], responses["HealthResearcher"])
+
+    results = [await evaluate(tier, args.fake, responses) for tier in args.tiers]
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare model routing tables on fixed queries.")
+    parser.add_argument("--tiers", nargs="+", default=["flash", "routed", "lite"],
+                        help='"lite", "flash", "pro", "routed", "env", or "Agent=tier,..." routes')
+    parser.add_argument("--fake", action="store_true", help="Use the fake model (no API calls)")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
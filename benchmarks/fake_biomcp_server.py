@@ -0,0 +1,56 @@
+"""
+Stub BioMCP server for offline benchmarks
+
+Speaks MCP over stdio like `biomcp run`, exposes the tools found in the
+recordings file and replays their recorded output after a fixed latency.
+
+Usage:
+    python fake_biomcp_server.py [recordings.json] [latency_seconds]
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import mcp.types as mcp_types
+from mcp.server.lowlevel import Server
+from mcp.server.stdio import stdio_server
+
+
+RECORDINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings", "biomcp_tools.json")
+
+
+def build_server(recordings: dict, latency: float) -> Server:
+    server = Server("fake-biomcp")
+
+    @server.list_tools()
+    async def list_tools():
+        return [
+            mcp_types.Tool(name=name, description=tool["description"], inputSchema=tool["inputSchema"])
+            for name, tool in recordings.items()
+        ]
+
+    @server.call_tool()
+    async def call_tool(name: str, arguments: dict):
+        await asyncio.sleep(latency)
+        if name not in recordings:
+            raise ValueError(f"Unknown tool: {name}")
+        return [mcp_types.TextContent(type="text", text=recordings[name]["result"])]
+
+    return server
+
+
+async def main(recordings_path: str, latency: float):
+    with open(recordings_path, encoding="utf-8") as f:
+        recordings = json.load(f)
+    server = build_server(recordings, latency)
+    async with stdio_server() as (read_stream, write_stream):
+        await server.run(read_stream, write_stream, server.create_initialization_options())
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        sys.argv[1] if len(sys.argv) > 1 else RECORDINGS,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.2,
+    ))
@@ -0,0 +1,95 @@
+"""
+Deterministic Gemini stand-in for offline benchmarks
+
+Replies with canned text per agent after a configurable latency, and
+replays a fixed tool-calling plan (e.g. BioResearcher's BioMCP lookups) so
+the pipeline's orchestration runs exactly as it would against the real model.
+"""
+
+import asyncio
+import json
+import os
+import re
+import uuid
+
+from google.genai import types
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+# Tool calls each agent makes (in order) before answering
+DEFAULT_TOOL_PLAN = {
+    "BioResearcher": [
+        ("trial_searcher", {"conditions": ["gardner syndrome"], "recruiting_status": "OPEN"}),
+        ("article_searcher", {"diseases": ["gardner syndrome"]}),
+        ("variant_searcher", {"gene": "APC", "significance": "pathogenic"}),
+    ],
+}
+
+
+def load_responses(path: str = os.path.join(RECORDINGS_DIR, "gemini_responses.json")) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _agent_name(llm_request) -> str:
+    """ADK names the agent in its system instruction."""
+    match = re.search(r'internal name is "([^"]+)"', str(llm_request.config.system_instruction or ""))
+    return match.group(1) if match else ""
+
+
+def _calls_this_turn(llm_request) -> int:
+    """Count model function calls since the last plain user message."""
+    calls = 0
+    for content in reversed(llm_request.contents):
+        parts = content.parts or []
+        if content.role == "user" and any(part.text for part in parts):
+            break
+        calls += sum(1 for part in parts if part.function_call)
+    return calls
+
+
+class FakeGemini(BaseLlm):
+    """A `Gemini` stand-in with configurable latency and canned responses."""
+
+    model: str = "gemini-2.5-flash"
+    latency: float = 0.5
+    agent_latency: dict[str, float] = {}
+    responses: dict[str, str] = {}
+    tool_plan: dict[str, list] = DEFAULT_TOOL_PLAN
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        agent = _agent_name(llm_request)
+        await asyncio.sleep(self.agent_latency.get(agent, self.latency))
+
+        declared = {
+            declaration.name
+            for tool in (llm_request.config.tools or [])
+            for declaration in (tool.function_declarations or [])
+        }
+        plan = [(name, args) for name, args in self.tool_plan.get(agent, []) if name in declared]
+        made = _calls_this_turn(llm_request)
+        prompt_chars = sum(
+            len(part.text or "") for content in llm_request.contents for part in (content.parts or [])
+        ) + len(str(llm_request.config.system_instruction or ""))
+
+        if made < len(plan):
+            name, args = plan[made]
+            part = types.Part(function_call=types.FunctionCall(id=f"fake-{uuid.uuid4().hex[:8]}", name=name, args=args))
+            text = ""
+        else:
+            text = self.responses.get(agent, f"{agent} response.")
+            part = types.Part(text=text)
+
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_chars // 4,
+            candidates_token_count=max(len(text) // 4, 1),
+        )
+        if stream and text:
+            words = text.split(" ")
+            for i in range(0, len(words), 8):
+                chunk = " ".join(words[i:i + 8]) + " "
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=chunk)]), partial=True)
+        yield LlmResponse(content=types.Content(role="model", parts=[part]), usage_metadata=usage)
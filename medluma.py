@@ -1,6 +1,8 @@
 # Import python packages
-import shutil
-import sys
+import argparse
+import asyncio
+import json
+import time
 import warnings
 import logging
 import uuid
@@ -12,157 +14,132 @@ logging.getLogger('asyncio').setLevel(logging.CRITICAL)
 logging.getLogger('google_genai.types').setLevel(logging.ERROR)
 logging.getLogger('google.adk').setLevel(logging.ERROR)
 
+# Setup progress goes to the log, keeping stdout for the run itself
+logger = logging.getLogger("medluma")
+
 # Gemini packages
 from google.genai import types
 
-# MCP and ADK packages
-from mcp import StdioServerParameters
+# ADK packages
 from google.adk.agents import LlmAgent, Agent, SequentialAgent, ParallelAgent, LoopAgent
-from google.adk.models.google_llm import Gemini
 from google.adk.runners import Runner, InMemoryRunner
-from google.adk.sessions import InMemorySessionService
-from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
-from google.adk.tools.tool_context import ToolContext
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
 from google.adk.apps.app import App, ResumabilityConfig
-from google.adk.tools.function_tool import FunctionTool
 from google.adk.tools.agent_tool import AgentTool
 from google.adk.tools.google_search_tool import google_search
 
-print("✅ Components imported successfully.")
+from medluma_agents import (
+    CoalescedAgent,
+    CritiqueGate,
+    PreferenceAgent,
+    PreferenceBranch,
+    TimeboxedAgent,
+    answer_flight_key,
+    query_flight_key,
+    remember_user_query,
+    use_requested_preference,
+)
+from medluma_batch import load_batch_queries, load_completed_ids, record_label, result_record
+from medluma_events import ApprovalDetector, StateCapture, process_events
+from medluma_index import DEFAULT_INDEX_FILE, BioIndex, bio_index_tool
+from medluma_mcp import BioMcpPool, PooledMcpToolset, ToolCallCache
+from medluma_models import ModelRouter
+from medluma_prompts import PromptBudget
+from medluma_ratelimit import deadline_scope
+from medluma_records import (
+    BIO_RESEARCH_FORMAT,
+    HEALTH_RESEARCH_FORMAT,
+    aggregator_instruction,
+    final_output_instruction,
+    structure_bio_research,
+    structure_health_research,
+)
+from medluma_refresh import DEFAULT_OUTPUT_STORE, OutputStore, reuse_unchanged_output, store_output
+from medluma_sessions import DEFAULT_SESSION_DB, create_session_service
+from medluma_stream import resume_message, stream_run
+from medluma_tracing import DEFAULT_TRACE_FILE, TracingPlugin
+
+logger.info("✅ Components imported successfully.")
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
 load_dotenv()
 
 
-# Setup retry configuration
-retry_config = types.HttpRetryOptions(
-    attempts=5,  # Maximum retry attempts
-    exp_base=7,  # Delay multiplier
-    initial_delay=1,
-    http_status_codes=[429, 500, 503, 504],  # Retry on these HTTP errors
-)
-
-print(f"✅ Retry configuration setp")
-
-
-# Locate biomcp and configure BioMCP mcp tool
-def find_biomcp():
-    """Locate biomcp executable."""
-    biomcp_path = shutil.which("biomcp")
-    if not biomcp_path:
-        possible_paths = [
-            os.path.join(sys.prefix, "bin", "biomcp"),
-            os.path.join(os.path.dirname(sys.executable), "biomcp"),
-            os.path.expanduser("~/.local/bin/biomcp")
-        ]
-        for path in possible_paths:
-            if os.path.exists(path):
-                biomcp_path = path
-                break
+# Model calls share process-wide rate limits per model and retry 429 / 5xx
+# errors with jittered backoff until their latency budget is spent (medluma_ratelimit.py)
+REQUEST_LATENCY_BUDGET = float(os.environ.get("MEDLUMA_REQUEST_BUDGET", "600"))
 
-        if biomcp_path:
-            print(f"Using BioMCP at: {biomcp_path}")
+# Each agent's model comes from the routing table (MEDLUMA_MODEL_ROUTES overrides it)
+route_model = ModelRouter.from_env()
 
-        else:
-            print("⚠️ biomcp not found - run !pip install biomcp-python")
+# Token budgets for the state interpolated into each prompt (MEDLUMA_PROMPT_BUDGETS overrides them)
+prompt_budget = PromptBudget.from_env()
 
-    print(f"✅ BioMCP loaded and located in path: {biomcp_path}")
-    return biomcp_path
+# Per-branch deadlines for the concurrent research stage (seconds)
+BIO_RESEARCH_TIMEOUT = float(os.environ.get("MEDLUMA_BIO_RESEARCH_TIMEOUT", "180"))
+HEALTH_RESEARCH_TIMEOUT = float(os.environ.get("MEDLUMA_HEALTH_RESEARCH_TIMEOUT", "90"))
 
+# How long a session waits for an identical in-flight query (seconds); 0 turns coalescing off
+COALESCE_TIMEOUT = float(os.environ.get("MEDLUMA_COALESCE_TIMEOUT", "300"))
 
-# Configure BioMCP MCP tool
-biomcp_path = find_biomcp()
+# Critique score (out of 10) that approves a draft without refining it
+CRITIQUE_SCORE_THRESHOLD = float(os.environ.get("MEDLUMA_CRITIQUE_SCORE_THRESHOLD", "8"))
 
-if not biomcp_path:
-    raise RuntimeError("biomcp executable not found. Please install with: pip install biomcp-python")
 
-mcp_bio_server = McpToolset(
-    connection_params=StdioConnectionParams(
-        server_params=StdioServerParameters(
-            command=biomcp_path,
-            args=["run"],
-            env={"MCP_LOG_LEVEL": "debug"}
-        ),
-        timeout=120,
-    )
+# Configure BioMCP MCP tool (the biomcp executable is located when the pool starts)
+bio_mcp_pool = BioMcpPool(
+    size=int(os.environ.get("MEDLUMA_BIOMCP_POOL_SIZE", "2")),
+    max_concurrency=int(os.environ.get("MEDLUMA_BIOMCP_MAX_CONCURRENCY", "8")),
+    log_level=os.environ.get("MEDLUMA_BIOMCP_LOG_LEVEL", "warning"),
+    timeout=120,
+    health_interval=float(os.environ.get("MEDLUMA_BIOMCP_HEALTH_INTERVAL", "30")),
 )
+tool_call_cache = ToolCallCache(
+    default_ttl=float(os.environ.get("MEDLUMA_TOOL_CACHE_TTL", "3600")),
+    max_bytes=int(float(os.environ.get("MEDLUMA_TOOL_CACHE_MB", "64")) * 1024 * 1024),
+)
+mcp_bio_server = PooledMcpToolset(pool=bio_mcp_pool, cache=tool_call_cache)
 
-print(f"✅ Created BioMCP mcp tool")
-
-
-# Pausable preference function tool
-def get_output_preference(tool_context: ToolContext) -> dict:
-    """Ask user for output preference."""
-    if not tool_context.tool_confirmation:
-        tool_context.request_confirmation(
-            hint="Would you like 'comprehensive' (detailed summaries + references) or 'simple' (article only) output?",
-            payload={"preference_type": "output_format"}
-        )
-        return {
-            "status": "pending",
-            "message": "Waiting for user preference..."
-        }
-    if tool_context.tool_confirmation.confirmed:
-        return {
-            "status": "confirmed",
-            "message": "User preference received."
-        }
-    else:
-        return {
-            "status": "rejected",
-            "message": "User cancelled."
-        }
-
-
-def exit_loop():
-    return {"status": "approved", "message": "Article approved."}
-
-print(f"✅ Define Get_output_preference and exit_loop functions")
-
+logger.info("✅ Created BioMCP mcp tool")
 
-# Helper function (check for approval)
-def check_for_approval(events):
-    """Check if events contain approval request."""
-    for event in events:
-        if event.content and event.content.parts:
-            for part in event.content.parts:
-                if (part.function_call and
-                    part.function_call.name == "adk_request_confirmation"):
-                    return {
-                        "approval_id": part.function_call.id,
-                        "invocation_id": event.invocation_id,
-                    }
-    return None
+# Local index of BioMCP snapshots, answered before BioMCP itself
+bio_index = BioIndex(
+    path=os.environ.get("MEDLUMA_BIO_INDEX", DEFAULT_INDEX_FILE),
+    max_age=float(os.environ.get("MEDLUMA_BIO_INDEX_MAX_AGE", str(7 * 24 * 3600))),
+)
+bio_index_lookup = bio_index_tool(bio_index, bio_mcp_pool)
 
-print(f"✅ Helper function created")
+# Last final output per query and preference: batch reruns reuse it when the
+# research fingerprint is unchanged (MEDLUMA_OUTPUT_STORE="" always regenerates)
+output_store_path = os.environ.get("MEDLUMA_OUTPUT_STORE", DEFAULT_OUTPUT_STORE)
+output_store = OutputStore(output_store_path) if output_store_path else None
 
 
 # Define all agents
 
-# Coordinator Agent
-coordinator_agent = Agent(
-    name="CoordinatorAgent",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    instruction="""Call get_output_preference tool. After user responds, check their message:
-    - If 'comprehensive': output "comprehensive"
-    - If 'simple': output "simple"
-    - Default: "simple"
-    Output ONLY the preference word.""",
-    tools=[FunctionTool(func=get_output_preference)],
+# Preference fallback agent
+preference_fallback_agent = Agent(
+    name="PreferenceFallbackAgent",
+    model=route_model("PreferenceFallbackAgent"),
+    instruction="""The user was asked to choose 'comprehensive' (detailed summaries + references)
+    or 'simple' (article only) output. Their reply: {preference_reply}
+    Output ONLY the preference word: "comprehensive" or "simple" (default: "simple").""",
     output_key="user_preference",
 )
-print("✅ coordinator_agent created.")
+
+# Coordinator Agent: resolves the reply locally; the fallback model only sees unclear replies
+coordinator_agent = PreferenceAgent(
+    name="CoordinatorAgent",
+    sub_agents=[preference_fallback_agent],
+    before_agent_callback=use_requested_preference,
+)
+logger.info("✅ coordinator_agent created.")
 
 
 # Biomedical researcher Agent: Search various online databases for information on clinical trials and current research for a particular disease or research area.
 bio_researcher = Agent(
     name="bio_researcher",
-    model=Gemini(
-        model="gemini-2.5-flash", 
-        retry_options=retry_config
-    ), 
+    model=route_model("BioResearcher"), 
     instruction="""You are a biomedical researcher. Use the mcp tool to find:
     1. current research findings,
      2. clinical trial information including the phase the trial is at and whether it is accepting patients,  
@@ -173,108 +150,88 @@ bio_researcher = Agent(
      7. currently available therapies and their effectiveness including FDA-approved drugs (and drugs 
      awaiting FDA approval) and emerging treatments.
      8. genetic markers linked to the disease.
-    After gathering the information, summarize the key findings in a concise report (200 words).
+    For trials, articles and variants, call lookup_biomedical_index first; use the other mcp tools
+    only for what it does not cover.
+    After gathering the information, record the key findings (about 200 words in total).
     Always include references to the sources of your information.
-    Include sections with headings for clarity. Output ONLY the report.""",
-    tools=[mcp_bio_server],
+    """ + BIO_RESEARCH_FORMAT,
+    tools=[bio_index_lookup, mcp_bio_server],
     output_key="bio_research",
+    after_agent_callback=structure_bio_research,
 )
-print("✅ bio_researcher created.")
+logger.info("✅ bio_researcher created.")
 
 
 # Health Researcher Agent: Performs google search focusing on medical breakthroughs for a particular disease or research area.
 health_researcher = Agent(
     name="HealthResearcher",
-    model=Gemini(
-        model="gemini-2.5-flash-lite",
-        retry_options=retry_config
-    ),
+    model=route_model("HealthResearcher"),
     instruction="""Research recent medical breakthroughs for a particular disease or research area. Include 3 significant advances,
-their practical applications, and estimated timelines. Keep the report concise (100 words). Include relevant references.""",
+their practical applications, and estimated timelines. Keep it concise (100 words). Include relevant references.
+""" + HEALTH_RESEARCH_FORMAT,
     tools=[google_search],
     output_key="health_research",  # The result will be stored with this key.
+    after_agent_callback=structure_health_research,
 )
 
-print("✅ health_researcher created.")
+logger.info("✅ health_researcher created.")
 
 
 # Aggregator Agent
 aggregator_agent = Agent(
     name="AggregatorAgent",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    instruction="""Combine these findings into an executive summary:
-    **Research:** {bio_research}
-    **News:** {health_research}
-    Highlight key takeaways (200 words).""",
+    model=route_model("AggregatorAgent"),
+    # Renders only the record fields the summary needs
+    instruction=aggregator_instruction(prompt_budget),
     output_key="executive_summary",
 )
-print("✅ aggregator_agent created.")
+logger.info("✅ aggregator_agent created.")
 
 
 # Scientific article writer agent
 initial_science_writer_agent = Agent(
     name="InitialScienceWriterAgent",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    instruction="""Based on: {executive_summary}, write a first draft article (100-150 words).
-    Output only the article text.""",
+    model=route_model("InitialScienceWriterAgent"),
+    instruction=prompt_budget.template("""Based on: {executive_summary}, write a first draft article (100-150 words).
+    Output only the article text."""),
     output_key="current_science_article",
 )
-print("✅ initial_science_writer_agent created.")
+logger.info("✅ initial_science_writer_agent created.")
 
 
 # Scientific and article critique agent
 critic_agent = Agent(
     name="CriticAgent",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    instruction="""Review: {current_science_article}
+    model=route_model("CriticAgent"),
+    instruction=prompt_budget.template("""Review: {current_science_article}
     If well-written with references: respond "APPROVED"
-    Otherwise: provide 2-3 suggestions.""",
+    Otherwise: provide 2-3 suggestions, then a final line "SCORE: n/10"."""),
     output_key="critique",
 )
-print("✅ critic_agent created.")
+logger.info("✅ critic_agent created.")
 
 
 # Article refiner agent
 refiner_agent = Agent(
     name="RefinerAgent",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    instruction="""Draft: {current_science_article}
+    model=route_model("RefinerAgent"),
+    instruction=prompt_budget.template("""Draft: {current_science_article}
     Critique: {critique}
-    If critique is "APPROVED": call exit_loop
-    Otherwise: rewrite incorporating feedback.""",
+    Rewrite the draft incorporating the feedback. Output only the article text."""),
     output_key="current_science_article",
-    tools=[FunctionTool(exit_loop)],
 )
-print("✅ refiner_agent created.")
+logger.info("✅ refiner_agent created.")
 
 
 # Final output agent
 final_output_agent = Agent(
     name="FinalOutputAgent",
-    model=Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config),
-    instruction="""Based on: {user_preference}
-    
-    If COMPREHENSIVE:
-    Use the {bio_research} output and create a final output with the following sections:
-
-    **BACKGROUND**
-    Provide context on the disease including definition, causes, risk factors and symptoms.
-
-    **SUMMARY**
-   Create a concise executive summary outlining key advances, their practical applications 
-   (including treatment options), and estimated timelines.
-    
-    **KEY DEVELOPMENTS**
-    {health_research} (2-3 points only)
-
-    **REFERENCES**
-    List all references used in research.
-    
-    If SIMPLE:
-    {current_science_article}""",
+    model=route_model("FinalOutputAgent"),
+    # Simple output only needs the article; comprehensive gets the rendered records
+    instruction=final_output_instruction(prompt_budget),
     output_key="final_output",
 )
-print("✅ final_output_agent created.")
+logger.info("✅ final_output_agent created.")
 
 
 # Pipeline Construction
@@ -282,42 +239,115 @@ print("✅ final_output_agent created.")
 # Article refinement loop
 article_refinement_loop = LoopAgent(
     name="ArticleRefinementLoop",
-    sub_agents=[critic_agent, refiner_agent],
+    sub_agents=[
+        critic_agent,
+        CritiqueGate(name="CritiqueGate", score_threshold=CRITIQUE_SCORE_THRESHOLD),
+        refiner_agent,
+    ],
     max_iterations=2,
 )
 
-# Research pipeline
-research_pipeline = SequentialAgent(
+# Research pipeline: run both researchers concurrently, each under its own deadline
+research_pipeline = ParallelAgent(
     name="ResearchPipeline",
     sub_agents=[
-        bio_researcher,      # Run FIRST (before pause)
-        health_researcher,   # Run SECOND (before pause)
+        TimeboxedAgent(
+            name="BioResearchBranch",
+            sub_agents=[bio_researcher],
+            output_key="bio_research",
+            timeout=BIO_RESEARCH_TIMEOUT,
+        ),
+        TimeboxedAgent(
+            name="HealthResearchBranch",
+            sub_agents=[health_researcher],
+            output_key="health_research",
+            timeout=HEALTH_RESEARCH_TIMEOUT,
+        ),
+    ],
+)
+
+# Concurrent batch sessions with the same query share one research run
+shared_research = CoalescedAgent(
+    name="SharedResearch",
+    sub_agents=[research_pipeline],
+    flight_key=query_flight_key,
+    output_keys=["bio_research", "health_research", "bio_research_status", "health_research_status"],
+    wait_timeout=COALESCE_TIMEOUT,
+)
+
+# Intake stage: research starts while the user is asked for a preference
+intake_stage = ParallelAgent(
+    name="IntakeStage",
+    sub_agents=[coordinator_agent, shared_research],
+)
+
+# Article pipeline: skipped when the user picks comprehensive output
+article_branch = PreferenceBranch(
+    name="ArticleBranch",
+    preferences=["simple"],
+    sub_agents=[
+        SequentialAgent(
+            name="ArticlePipeline",
+            sub_agents=[
+                aggregator_agent,               # Aggregate results
+                initial_science_writer_agent,   # Write article
+                article_refinement_loop,        # Refine
+            ],
+        ),
+    ],
+)
+
+# Output stage: skipped when the research matches the last stored run
+output_stage = SequentialAgent(
+    name="OutputStage",
+    sub_agents=[
+        article_branch,                 # Resume: article for simple output only
+        final_output_agent,             # Format output
     ],
+    before_agent_callback=reuse_unchanged_output(output_store),
+)
+
+# ... and, with the same preference, one article and final output
+shared_output = CoalescedAgent(
+    name="SharedOutput",
+    sub_agents=[output_stage],
+    flight_key=answer_flight_key,
+    output_keys=["final_output"],
+    follower_state={"final_output_status": "coalesced"},
+    content_key="final_output",
+    wait_timeout=COALESCE_TIMEOUT,
 )
 
 # Root Agent to orchestrate agent flow
 test_root_agent = SequentialAgent(
     name="TestPipeline",
     sub_agents=[
-        coordinator_agent,              # THEN ask for preference (pause here)
-        research_pipeline,              # Do all research FIRST
-        aggregator_agent,               # Resume: aggregate results
-        initial_science_writer_agent,   # Write article
-        article_refinement_loop,        # Refine
-        final_output_agent,             # Format output
+        intake_stage,                   # Ask for preference (pause) while researching
+        shared_output,                  # Article and final output, unless unchanged or in flight
     ],
+    before_agent_callback=remember_user_query,
+    after_agent_callback=store_output(output_store),
 )
 
-print(f"✅ Pipeline constructed")
+logger.info("✅ Pipeline constructed")
 
 
 # App and Runner setup
-session_service = InMemorySessionService()
+# Sessions (including ones paused on the preference question) live in SQLite,
+# so they survive restarts and can be resumed by another worker process.
+# MEDLUMA_SESSION_DB="memory://" keeps them in process memory instead.
+session_service = create_session_service(
+    os.environ.get("MEDLUMA_SESSION_DB", DEFAULT_SESSION_DB),
+    paused_ttl=float(os.environ.get("MEDLUMA_PAUSED_SESSION_TTL", "3600")),
+)
 
 # Renamed from test_app to _archived_test_app to prevent ADK auto-discovery
+trace_file = os.environ.get("MEDLUMA_TRACE_FILE", DEFAULT_TRACE_FILE)
+
 _archived_test_app = App(
     name="article_coordinator_test",
     root_agent=test_root_agent,
+    plugins=[TracingPlugin(path=trace_file)] if trace_file else [],
     resumability_config=ResumabilityConfig(is_resumable=True),
 )
 
@@ -326,11 +356,17 @@ test_runner = Runner(
     session_service=session_service,
 )
 
-print(f"✅ App and Runner configured")
+logger.info("✅ App and Runner configured")
+
 
+async def run_test_workflow(query: str, preference: str = None):
+    """Run workflow with user interaction.
 
-async def run_test_workflow(query: str):
-    """Run workflow with user interaction."""
+    With `preference` set, the preference question is skipped entirely.
+    """
+
+    # Warm up the BioMCP servers before the first research call needs them
+    await bio_mcp_pool.start()
     
     print(f"\n{'='*60}")
     print(f"User > {query}\n")
@@ -344,66 +380,162 @@ async def run_test_workflow(query: str):
     )
     
     query_content = types.Content(role="user", parts=[types.Part(text=query)])
-    events = []
-    
+    # Each event is handled as it arrives; only the approval request and the final output are kept
+    approval = ApprovalDetector()
+    captured = StateCapture("final_output")
+
     print("🔄 Starting...")
-    async for event in test_runner.run_async(
-        user_id="test_user",
-        session_id=session_id,
-        new_message=query_content
-    ):
-        events.append(event)
-    
-    approval_info = check_for_approval(events)
-    
+    run_task = asyncio.create_task(process_events(
+        test_runner.run_async(
+            user_id="test_user",
+            session_id=session_id,
+            new_message=query_content,
+            state_delta={"user_preference": preference} if preference else None,
+        ),
+        approval,
+        captured,
+    ))
+    # The question arrives while research is still running; ask right away
+    approval_wait = asyncio.create_task(approval.found.wait())
+    await asyncio.wait([run_task, approval_wait], return_when=asyncio.FIRST_COMPLETED)
+    approval_wait.cancel()
+    approval_info = approval.approval
     if approval_info:
-        print(f"⏸️  Pausing for preference...\n")
-        
-        user_choice = input("Your choice (comprehensive/simple): ").strip()
+        print(f"⏸️  Research continues while you choose...\n")
+        user_choice = (await asyncio.to_thread(input, "Your choice (comprehensive/simple): ")).strip()
         print(f"\n✅ You selected: {user_choice}\n")
-        
-        confirmation_response = types.FunctionResponse(
-            id=approval_info["approval_id"],
-            name="adk_request_confirmation",
-            response={"confirmed": True},
-        )
-        
-        combined_content = types.Content(
-            role="user",
-            parts=[
-                types.Part(function_response=confirmation_response),
-                types.Part(text=user_choice)
-            ]
-        )
-        
+    await run_task
+
+    if approval_info:
         print("🔄 Resuming...")
-        async for event in test_runner.run_async(
+        streamed = False
+        async for chunk in stream_run(
+            test_runner,
             user_id="test_user",
             session_id=session_id,
-            new_message=combined_content,
+            new_message=resume_message(approval_info["approval_id"], user_choice),
             invocation_id=approval_info["invocation_id"],
         ):
-            pass  # Just process
+            if chunk["type"] == "stage":
+                print(f"▶️  {chunk['agent']}")
+            elif chunk["type"] == "text":
+                if not streamed:
+                    print("\n" + "="*60)
+                    print("FINAL OUTPUT:")
+                    print("="*60)
+                    streamed = True
+                print(chunk["text"], end="", flush=True)
         
-        print(f"✅ Completed\n")
+        print(f"\n✅ Completed\n")
+        if streamed:
+            return
     
-    # Display output
-    session = await session_service.get_session(
-    app_name="article_coordinator_test",  # Use the actual app name
-    user_id="test_user",                  # Use the actual user ID
-    session_id=session_id
-    )
-    if session and 'final_output' in session.state:
+    # Display output: captured from the run's events, or read back after a resume
+    final_output = captured.get("final_output")
+    session = None
+    if final_output is None:
+        session = await session_service.get_session(
+            app_name="article_coordinator_test",
+            user_id="test_user",
+            session_id=session_id
+        )
+        final_output = session.state.get("final_output") if session else None
+    if final_output:
         print("\n" + "="*60)
         print("FINAL OUTPUT:")
         print("="*60)
-        print(session.state['final_output'])
+        print(final_output)
     elif session:
         print(f"\nState keys: {list(session.state.keys())}")
     else:
         print("\nSession not found")
 
+
+# Batch mode
+async def run_batch_query(item: dict) -> dict:
+    """Run one query through test_runner with its preference preset."""
+    session_id = f"batch_{uuid.uuid4().hex[:8]}"
+    await session_service.create_session(
+        app_name="article_coordinator_test",
+        user_id="batch_user",
+        session_id=session_id
+    )
+
+    started = time.time()
+    query_content = types.Content(role="user", parts=[types.Part(text=item["query"])])
+    # The preference is known up front, so the coordinator never pauses;
+    # only the output keys are kept from the run's events
+    captured = StateCapture("final_output", "final_output_status")
+    with deadline_scope(REQUEST_LATENCY_BUDGET):
+        await process_events(
+            test_runner.run_async(
+                user_id="batch_user",
+                session_id=session_id,
+                new_message=query_content,
+                state_delta={"user_preference": item["preference"]},
+            ),
+            captured,
+        )
+
+    # The finished session is no longer needed; keep memory flat over long batches
+    await session_service.delete_session(
+        app_name="article_coordinator_test",
+        user_id="batch_user",
+        session_id=session_id
+    )
+
+    return result_record(item, captured.get("final_output"), captured.get("final_output_status"),
+                         time.time() - started)
+
+
+async def run_batch(input_path: str, output_path: str, concurrency: int = 4,
+                    default_preference: str = "simple"):
+    """Process a file of queries with bounded concurrency, appending results as JSONL.
+
+    Queries already written with status "ok" are skipped, so an interrupted
+    batch can simply be restarted with the same arguments.
+    """
+    await bio_mcp_pool.start()
+
+    queries = load_batch_queries(input_path, default_preference)
+    completed = load_completed_ids(output_path)
+    pending = [item for item in queries if item["id"] not in completed]
+    print(f"🔄 {len(pending)} queries to run ({len(queries) - len(pending)} already done)")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    done = 0
+
+    async def process(item):
+        nonlocal done
+        async with semaphore:
+            try:
+                record = await run_batch_query(item)
+            except Exception as e:
+                record = {**item, "status": "error", "error": str(e)}
+        async with write_lock:
+            with open(output_path, "a", encoding="utf-8") as out:
+                out.write(json.dumps(record) + "\n")
+            done += 1
+            icon = "✅" if record["status"] == "ok" else "⚠️"
+            print(f"{icon} [{done}/{len(pending)}] {item['query']} ({record_label(record)})")
+
+    await asyncio.gather(*(process(item) for item in pending))
+    print(f"🧮 BioMCP tool cache: {tool_call_cache.stats()}")
+    await bio_mcp_pool.close()
+
+
 if __name__ == "__main__":
-    import asyncio
-    user_query = "Summarize recent advances in the treatment of gardener syndrome"
-    asyncio.run(run_test_workflow(user_query))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the Medluma pipeline.")
+    parser.add_argument("--batch", metavar="QUERIES", help="JSONL or CSV file of queries to process")
+    parser.add_argument("--output", default="medluma_batch_results.jsonl", help="JSONL file for batch results")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent sessions in batch mode")
+    parser.add_argument("--preference", choices=["simple", "comprehensive"],
+                        help="Output preference (skips the question); batch default: simple")
+    args = parser.parse_args()
+
+    if args.batch:
+        asyncio.run(run_batch(args.batch, args.output, args.concurrency, args.preference or "simple"))
+    else:
+        user_query = "Summarize recent advances in the treatment of gardener syndrome"
+        asyncio.run(run_test_workflow(user_query, args.preference))
\ No newline at end of file
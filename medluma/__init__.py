@@ -1,6 +1,13 @@
 # Medluma AI Agent Package
 # This file makes the directory a Python package
 
-from medluma_app import app, root_agent
+import medluma_app
 
 __all__ = ['app', 'root_agent']
+
+
+def __getattr__(name):
+    # Deferred so importing the package does not build the pipeline
+    if name in __all__:
+        return getattr(medluma_app, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
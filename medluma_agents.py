@@ -0,0 +1,501 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Custom workflow agents shared by medluma_app.py and medluma.py
+"""
+
+import asyncio
+import difflib
+import json
+import logging
+import re
+from typing import AsyncGenerator, Callable, Optional
+
+from google.genai import types
+from google.adk.agents import BaseAgent
+from google.adk.agents.base_agent import BaseAgentState
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.flows.llm_flows.functions import (
+    REQUEST_CONFIRMATION_FUNCTION_CALL_NAME,
+    generate_client_function_call_id,
+)
+from google.adk.tools.tool_confirmation import ToolConfirmation
+from google.adk.utils.context_utils import Aclosing
+
+from medluma_cache import normalize_query
+
+
+logger = logging.getLogger(__name__)
+
+
+def _final_text(event: Event):
+    """Return the text of a complete model response event, if any."""
+    if event.partial or not event.content or not event.content.parts:
+        return None
+    if event.get_function_calls() or event.get_function_responses():
+        return None
+    text = "".join(part.text for part in event.content.parts if part.text and not part.thought)
+    return text or None
+
+
+class TimeboxedAgent(BaseAgent):
+    """Run a single sub-agent under a deadline.
+
+    If the sub-agent times out or raises, the last text it produced (or
+    `fallback_text`) is written to `output_key` so the rest of the pipeline
+    can carry on with a partial result. `<output_key>_status` records why.
+    """
+
+    output_key: str
+    timeout: float = 120.0
+    fallback_text: str = "No results available: this research step did not complete."
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        sub_agent = self.sub_agents[0]
+        queue = asyncio.Queue()
+        finished = object()
+
+        # Drive the sub-agent in its own task so the deadline can be enforced
+        # between events. Each event waits for the runner to consume it, the
+        # same hand-off ParallelAgent uses.
+        async def pump():
+            try:
+                async with Aclosing(sub_agent.run_async(ctx)) as agen:
+                    async for event in agen:
+                        resume_signal = asyncio.Event()
+                        await queue.put((event, resume_signal))
+                        await resume_signal.wait()
+            except Exception as e:
+                await queue.put((e, None))
+            else:
+                await queue.put((finished, None))
+
+        # Record that the branch has started. Besides resumability bookkeeping,
+        # this keeps LlmAgent's end-of-run check from indexing an empty branch
+        # history when the sub-agent answers in a single event.
+        if ctx.is_resumable:
+            ctx.set_agent_state(self.name, agent_state=BaseAgentState())
+            yield self._create_agent_state_event(ctx)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        task = asyncio.create_task(pump())
+        status = None
+        last_text = None
+        try:
+            while True:
+                try:
+                    item, resume_signal = await asyncio.wait_for(
+                        queue.get(), timeout=max(deadline - loop.time(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    status = "timeout"
+                    logger.warning("%s timed out after %.0fs", sub_agent.name, self.timeout)
+                    break
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    status = "error"
+                    logger.warning("%s failed: %s", sub_agent.name, item, exc_info=item)
+                    break
+                last_text = _final_text(item) or last_text
+                yield item
+                resume_signal.set()
+        finally:
+            task.cancel()
+
+        if status:
+            yield Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=ctx.branch,
+                actions=EventActions(state_delta={
+                    self.output_key: last_text or self.fallback_text,
+                    f"{self.output_key}_status": status,
+                }),
+            )
+
+        if ctx.is_resumable:
+            ctx.set_agent_state(self.name, end_of_agent=True)
+            yield self._create_agent_state_event(ctx)
+
+
+# (agent name, flight key) -> future resolved with the leader's output values,
+# or None when followers should run the stage themselves
+_in_flight: dict[tuple[str, str], asyncio.Future] = {}
+
+
+class CoalescedAgent(BaseAgent):
+    """Run a stage once for concurrent sessions that share the same key.
+
+    `flight_key(state)` names the work (e.g. the normalized query); None
+    opts a session out, and a `wait_timeout` of 0 turns coalescing off.
+    The first session to reach the stage with a key runs the sub-agents as
+    usual. Sessions arriving while it runs wait for it and copy its
+    `output_keys` from state instead, plus `follower_state`; with
+    `content_key` set, that value is also emitted as the response text.
+
+    If the leader fails, is cancelled or pauses, or a follower waits longer
+    than `wait_timeout`, the follower runs the sub-agents itself.
+    """
+
+    flight_key: Callable[[dict], Optional[str]]
+    output_keys: list[str]
+    follower_state: dict = {}
+    content_key: Optional[str] = None
+    wait_timeout: float = 600.0
+
+    async def _follow(self, flight: asyncio.Future) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s: gave up waiting for the in-flight run after %.0fs", self.name, self.wait_timeout)
+            return None
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        if ctx.is_resumable:
+            ctx.set_agent_state(self.name, agent_state=BaseAgentState())
+            yield self._create_agent_state_event(ctx)
+
+        loop = asyncio.get_running_loop()
+        key = self.flight_key(ctx.session.state) if self.wait_timeout > 0 else None
+        flight = None
+        if key:
+            leader = _in_flight.get((self.name, key))
+            if leader is not None and leader.get_loop() is loop:
+                values = await self._follow(leader)
+                if values is not None:
+                    logger.info("%s: reusing the in-flight result for %r", self.name, key)
+                    text = values.get(self.content_key) if self.content_key else None
+                    yield Event(
+                        invocation_id=ctx.invocation_id,
+                        author=self.name,
+                        branch=ctx.branch,
+                        content=types.Content(role="model", parts=[types.Part(text=text)]) if text else None,
+                        actions=EventActions(state_delta={**values, **self.follower_state}),
+                    )
+                    if ctx.is_resumable:
+                        ctx.set_agent_state(self.name, end_of_agent=True)
+                        yield self._create_agent_state_event(ctx)
+                    return
+            else:
+                flight = loop.create_future()
+                _in_flight[(self.name, key)] = flight
+
+        values = None
+        try:
+            pause_invocation = False
+            for sub_agent in self.sub_agents:
+                async with Aclosing(sub_agent.run_async(ctx)) as agen:
+                    async for event in agen:
+                        yield event
+                        if ctx.should_pause_invocation(event):
+                            pause_invocation = True
+                if pause_invocation:
+                    return
+            state = ctx.session.state
+            values = {output_key: state[output_key] for output_key in self.output_keys if output_key in state}
+        finally:
+            if flight is not None:
+                if _in_flight.get((self.name, key)) is flight:
+                    del _in_flight[(self.name, key)]
+                if not flight.done():
+                    flight.set_result(values or None)
+
+        if ctx.is_resumable:
+            ctx.set_agent_state(self.name, end_of_agent=True)
+            yield self._create_agent_state_event(ctx)
+
+
+# Words that pick an output format; the first one is the canonical name
+PREFERENCE_KEYWORDS = {
+    "comprehensive": ("comprehensive", "detailed", "detail", "full", "complete", "thorough",
+                      "professional", "references", "everything", "long"),
+    "simple": ("simple", "article", "short", "brief", "basic", "quick", "plain", "easy", "layman"),
+}
+# Words that negate or qualify a keyword a few words later ("not too long",
+# "I don't want it long"); such replies are left to the fallback
+_NEGATIONS = {"not", "no", "dont", "don't", "doesn't", "without", "never", "nor", "too", "less"}
+_NEGATION_WINDOW = 3
+
+
+def match_preference(text) -> Optional[str]:
+    """Resolve a free-form reply to "comprehensive" or "simple", or None if unclear.
+
+    Matches keywords and close misspellings of the two format names. A
+    keyword with a negation in the few words before it ("not too long",
+    "I don't want it long") makes the reply unclear, as do replies that
+    match both formats or neither; those are left to the caller.
+    """
+    words = re.findall(r"[a-z']+", str(text or "").lower())
+    found = set()
+    for index, word in enumerate(words):
+        for preference, keywords in PREFERENCE_KEYWORDS.items():
+            if word in keywords or (len(word) >= 4 and difflib.get_close_matches(word, keywords[:1], cutoff=0.8)):
+                if _NEGATIONS.intersection(words[max(0, index - _NEGATION_WINDOW):index]):
+                    return None
+                found.add(preference)
+    return found.pop() if len(found) == 1 else None
+
+
+def normalize_preference(value) -> str:
+    """Map free-form preference text to "comprehensive" or "simple" (the default)."""
+    return match_preference(value) or "simple"
+
+
+def requested_preference(callback_context: CallbackContext) -> Optional[str]:
+    """The preference sent with the current request, if any.
+
+    Clients pass it as `run_async(..., state_delta={"user_preference": ...})`;
+    only a preference sent with the current invocation counts, so a session
+    reused for a new query is still asked.
+    """
+    ctx = callback_context._invocation_context
+    for event in reversed(ctx.session.events):
+        if event.invocation_id != ctx.invocation_id:
+            break
+        requested = event.actions.state_delta.get("user_preference") if event.author == "user" else None
+        if requested:
+            return normalize_preference(requested)
+    return None
+
+
+def use_requested_preference(callback_context: CallbackContext):
+    """Skip the preference question when the request already carries one."""
+    preference = requested_preference(callback_context)
+    if not preference:
+        return None
+    callback_context.state["user_preference"] = preference
+    return types.Content(role="model", parts=[types.Part(text=preference)])
+
+
+# Per-query results that must not leak into the next query of a reused session
+QUERY_RESULT_KEYS = ("final_output", "final_output_status", "bio_research_status", "health_research_status",
+                     "research_fingerprint")
+
+
+def _is_resumed(callback_context: CallbackContext) -> bool:
+    """True if the current invocation already ran before this turn (a resume)."""
+    ctx = callback_context._invocation_context
+    return any(event.invocation_id == ctx.invocation_id and event.author != "user"
+               for event in ctx.session.events)
+
+
+def remember_user_query(callback_context: CallbackContext):
+    """Record each new query in state; resumed turns only carry the preference.
+
+    A session reused for another question starts over: the previous run's
+    output and statuses are cleared, so the old answer is never stored under
+    the new query and stale statuses neither mark the new results as partial
+    nor keep them out of the caches.
+    """
+    if _is_resumed(callback_context):
+        return None
+    user_content = callback_context.user_content
+    if user_content and user_content.parts:
+        query = " ".join(part.text for part in user_content.parts if part.text).strip()
+        if query:
+            state = callback_context.state
+            for key in QUERY_RESULT_KEYS:
+                if state.get(key) is not None:
+                    state[key] = None
+            state["user_query"] = query
+    return None
+
+
+def query_flight_key(state) -> Optional[str]:
+    """CoalescedAgent key: sessions asking the same normalized query share a run."""
+    return normalize_query(state.get("user_query", "")) or None
+
+
+def answer_flight_key(state) -> Optional[str]:
+    """CoalescedAgent key: the normalized query and output preference."""
+    query = query_flight_key(state)
+    return query and f"{normalize_preference(state.get('user_preference'))}:{query}"
+
+
+class PreferenceBranch(BaseAgent):
+    """Run a sub-agent only for the listed output preferences.
+
+    Lets the pipeline skip stages whose outputs the chosen format never
+    reads, e.g. the article writer and refinement loop for "comprehensive".
+    """
+
+    preferences: list[str]
+    state_key: str = "user_preference"
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        preference = normalize_preference(ctx.session.state.get(self.state_key))
+        if preference in self.preferences:
+            pause_invocation = False
+            for sub_agent in self.sub_agents:
+                async with Aclosing(sub_agent.run_async(ctx)) as agen:
+                    async for event in agen:
+                        yield event
+                        if ctx.should_pause_invocation(event):
+                            pause_invocation = True
+                if pause_invocation:
+                    return
+        else:
+            logger.info("%s skipped for %r output", self.name, preference)
+
+        if ctx.is_resumable:
+            ctx.set_agent_state(self.name, end_of_agent=True)
+            yield self._create_agent_state_event(ctx)
+
+
+_SCORE_PATTERN = re.compile(r"SCORE:\s*(\d+(?:\.\d+)?)\s*/\s*10", re.IGNORECASE)
+# The verdict opens the critique ("APPROVED", "**APPROVED**"); a later mention
+# ("could be approved once...", "Not approved yet") is not one
+_APPROVED_PATTERN = re.compile(r"[\s*_\"'`]*APPROVED\b")
+
+
+def critique_approves(critique, score_threshold: Optional[float] = None) -> bool:
+    """True if a critique opens with "APPROVED" or scores at least `score_threshold`/10."""
+    text = str(critique or "")
+    if _APPROVED_PATTERN.match(text):
+        return True
+    if score_threshold is None:
+        return False
+    match = _SCORE_PATTERN.search(text)
+    return bool(match) and float(match.group(1)) >= score_threshold
+
+
+class CritiqueGate(BaseAgent):
+    """Stop a refinement LoopAgent as soon as the critique approves the draft.
+
+    Sits between the critic and the refiner and decides from `critique_key`
+    alone, so an approved draft costs no refiner call. With `score_threshold`
+    set, a "SCORE: n/10" line at or above the threshold also approves.
+    """
+
+    critique_key: str = "critique"
+    score_threshold: Optional[float] = None
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        if critique_approves(ctx.session.state.get(self.critique_key), self.score_threshold):
+            logger.info("%s: draft approved, ending refinement", self.name)
+            yield Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=ctx.branch,
+                actions=EventActions(escalate=True),
+            )
+
+        if ctx.is_resumable:
+            ctx.set_agent_state(self.name, end_of_agent=True)
+            yield self._create_agent_state_event(ctx)
+
+
+class PreferenceAgent(BaseAgent):
+    """Ask for the output preference and resolve the reply without a model call.
+
+    The first run emits the same `adk_request_confirmation` pause the
+    `get_output_preference` tool used to produce. On resume, the text sent
+    with the confirmation is matched with `match_preference` and written to
+    `state_key`. Only unclear replies go to the optional fallback sub-agent,
+    which reads the reply from `reply_key` and writes `state_key` itself.
+    """
+
+    hint: str = (
+        "Would you like 'comprehensive' (detailed summaries + references) "
+        "or 'simple' (article only) output?"
+    )
+    payload: dict = {"preference_type": "output_format"}
+    state_key: str = "user_preference"
+    reply_key: str = "preference_reply"
+
+    def _find_request(self, ctx: InvocationContext):
+        """Return the id of this invocation's pending confirmation request, if any."""
+        for event in ctx.session.events:
+            if event.invocation_id != ctx.invocation_id or event.author != self.name:
+                continue
+            for call in event.get_function_calls():
+                if call.name == REQUEST_CONFIRMATION_FUNCTION_CALL_NAME:
+                    return call.id
+        return None
+
+    def _find_reply(self, ctx: InvocationContext, request_id: str):
+        """Return (confirmed, reply text) from the user's answer to `request_id`."""
+        for event in reversed(ctx.session.events):
+            if event.author != "user" or event.invocation_id != ctx.invocation_id:
+                continue
+            for response in event.get_function_responses():
+                if response.id == request_id:
+                    confirmation = response.response or {}
+                    # The ADK web client wraps the confirmation as {"response": "<json>"}
+                    if isinstance(confirmation.get("response"), str):
+                        try:
+                            confirmation = json.loads(confirmation["response"])
+                        except (json.JSONDecodeError, TypeError):
+                            logger.warning("%s: unreadable confirmation %r", self.name, confirmation["response"])
+                            confirmation = {}
+                        if not isinstance(confirmation, dict):
+                            confirmation = {}
+                    text = " ".join(part.text for part in event.content.parts if part.text).strip()
+                    return bool(confirmation.get("confirmed")), text
+        return None
+
+    def _request_event(self, ctx: InvocationContext) -> Event:
+        original_call = types.FunctionCall(
+            id=generate_client_function_call_id(), name="get_output_preference", args={}
+        )
+        request_call = types.FunctionCall(
+            id=generate_client_function_call_id(),
+            name=REQUEST_CONFIRMATION_FUNCTION_CALL_NAME,
+            args={
+                "originalFunctionCall": original_call.model_dump(exclude_none=True, by_alias=True),
+                "toolConfirmation": ToolConfirmation(hint=self.hint, payload=self.payload).model_dump(
+                    by_alias=True, exclude_none=True
+                ),
+            },
+        )
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(function_call=request_call)]),
+            long_running_tool_ids={request_call.id},
+        )
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        request_id = self._find_request(ctx)
+        reply = self._find_reply(ctx, request_id) if request_id else None
+        if reply is None:
+            # Ask (or ask again if resumed without an answer); the invocation pauses here
+            yield self._request_event(ctx)
+            return
+
+        confirmed, text = reply
+        preference = match_preference(text) if confirmed else "simple"
+        if preference is None and text and self.sub_agents:
+            logger.info("%s: unclear reply %r, asking the fallback model", self.name, text)
+            fallback = self.sub_agents[0]
+            # A branch of its own keeps the fallback LlmAgent from treating the
+            # confirmation reply as a tool confirmation it has to resume
+            fallback_ctx = ctx.model_copy()
+            fallback_ctx.branch = f"{ctx.branch}.{fallback.name}" if ctx.branch else fallback.name
+            yield Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=fallback_ctx.branch,
+                actions=EventActions(state_delta={self.reply_key: text}),
+            )
+            async with Aclosing(fallback.run_async(fallback_ctx)) as agen:
+                async for event in agen:
+                    yield event
+            preference = ctx.session.state.get(self.state_key)
+
+        preference = normalize_preference(preference)
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=preference)]),
+            actions=EventActions(state_delta={self.state_key: preference}),
+        )
+
+        if ctx.is_resumable:
+            ctx.set_agent_state(self.name, end_of_agent=True)
+            yield self._create_agent_state_event(ctx)
@@ -0,0 +1,68 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Batch query files and result records: shared by the single-process batch
+mode (medluma.py) and the worker pool (medluma_workers.py)
+"""
+
+import csv
+import json
+import os
+
+
+def load_batch_queries(path: str, default_preference: str = "simple"):
+    """Read queries from a JSONL or CSV file (fields: query, preference, optional id)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    queries = []
+    for row in rows:
+        query = (row.get("query") or "").strip()
+        if not query:
+            continue
+        preference = (row.get("preference") or default_preference).strip().lower()
+        queries.append({
+            "id": row.get("id") or f"{query}|{preference}",
+            "query": query,
+            "preference": preference,
+        })
+    return queries
+
+
+def load_completed_ids(path: str):
+    """Return ids already written successfully to a batch output file."""
+    if not os.path.exists(path):
+        return set()
+    completed = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial last line from an interrupted run
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def result_record(item: dict, final_output, final_output_status, elapsed_seconds: float) -> dict:
+    """The results-file record of a finished query."""
+    return {
+        **item,
+        "status": "ok" if final_output else "incomplete",
+        "final_output": final_output,
+        "reused": final_output_status == "unchanged",
+        "coalesced": final_output_status == "coalesced",
+        "elapsed_seconds": round(elapsed_seconds, 2),
+    }
+
+
+def record_label(record: dict) -> str:
+    """Short status of a record for progress lines."""
+    if record.get("reused"):
+        return "unchanged"
+    if record.get("coalesced"):
+        return "coalesced"
+    return record["status"]
@@ -0,0 +1,376 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Disease-keyed research cache (SQLite, TTL + LRU eviction) and a semantic
+cache of final outputs for near-duplicate queries
+"""
+
+import importlib.util
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a user query into a cache key."""
+    text = unicodedata.normalize("NFKD", query or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return " ".join(text.split())
+
+
+class ResearchCache:
+    """Persistent cache of `bio_research` / `health_research` per query.
+
+    Entries expire after `ttl` seconds; once more than `max_entries` are
+    stored, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, max_entries: int = 500):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS research (
+                key TEXT PRIMARY KEY,
+                bio_research TEXT NOT NULL,
+                health_research TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS research_accessed ON research (accessed_at)")
+
+    def get(self, query: str):
+        """Return cached research for `query`, or None on a miss."""
+        key = normalize_query(query)
+        if not key:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bio_research, health_research, created_at FROM research WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM research WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE research SET accessed_at = ? WHERE key = ?", (now, key))
+        return {"bio_research": row[0], "health_research": row[1]}
+
+    def put(self, query: str, bio_research: str, health_research: str):
+        """Store research for `query` and evict expired / least recently used entries."""
+        key = normalize_query(query)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO research (key, bio_research, health_research, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    bio_research = excluded.bio_research,
+                    health_research = excluded.health_research,
+                    created_at = excluded.created_at,
+                    accessed_at = excluded.accessed_at""",
+                (key, bio_research, health_research, now, now),
+            )
+            self._conn.execute("DELETE FROM research WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                """DELETE FROM research WHERE key IN (
+                    SELECT key FROM research ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Semantic cache: near-duplicate queries map to the same final output
+
+# Words that only frame the request. Every answer covers recent advances, so
+# "latest", "news" or "tell me about" do not change it.
+FILLER_QUERY_WORDS = frozenset("""
+    a about advance advances advancement advancements an and any are breakthrough breakthroughs current
+    developments for in info information is latest me more new news novel of on recent research summarize
+    summary tell the update updates what whats with
+""".split())
+
+# Intent words with the same meaning share one term; other intent words
+# ("prognosis", "hereditary", "children") are kept as they are
+INTENT_SYNONYMS = {
+    word: "treatment"
+    for word in """cure cures drug drugs medication medications options therapies therapy treat
+                   treating treatment treatments""".split()
+}
+
+
+# Bumped when query_terms changes, so entries indexed under the old terms are dropped
+QUERY_TERMS_VERSION = 2
+
+
+def query_terms(query: str) -> str:
+    """The subject and intent of a query: normalized words without filler, synonyms merged."""
+    # A lone "s" is a possessive leftover ("gardner's"); other letters matter ("hepatitis b")
+    words = [word for word in normalize_query(query).split() if word != "s"]
+    terms = []
+    for word in words:
+        term = INTENT_SYNONYMS.get(word, word)
+        if word not in FILLER_QUERY_WORDS and term not in terms:
+            terms.append(term)
+    return " ".join(terms or words)
+
+
+def _edit_distance_at_most_one(a: str, b: str) -> bool:
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:] if len(a) < len(b) else a[i + 1:] == b[i:]
+
+
+def same_terms(terms: str, other: str) -> bool:
+    """True if two `query_terms` name the same subject and intent.
+
+    Every term must pair up with one of the other's. Words of five or more
+    letters may differ by one edit ("gardener" / "gardner"); shorter words
+    and numbers must match exactly, and a missing or extra term ("male
+    breast cancer", "gardner syndrome prognosis") never matches.
+    """
+    left, right = terms.split(), other.split()
+    if len(left) != len(right):
+        return False
+    unmatched = list(right)
+    for word in left:
+        match = next((candidate for candidate in unmatched if candidate == word or (
+            min(len(word), len(candidate)) >= 5 and not word.isdigit() and not candidate.isdigit()
+            and _edit_distance_at_most_one(word, candidate))), None)
+        if match is None:
+            return False
+        unmatched.remove(match)
+    return True
+
+
+class HashingEmbedder:
+    """Dependency-free embeddings: hashed character n-grams with sublinear TF.
+
+    Character n-grams make spelling variants ("gardener" / "gardner") land
+    close together. crc32 keeps the hashing stable across processes.
+    """
+
+    def __init__(self, dim: int = 2048, ngram_range: tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.name = f"hashing-{dim}-{ngram_range[0]}-{ngram_range[1]}"
+        # N-grams barely tell "type 1" from "type 2 diabetes" (~0.9) or an
+        # extra intent word (~0.8-0.9), so similarity alone must be near-exact;
+        # spelling variants (~0.75-0.9) are matched by their terms instead
+        self.default_threshold = 0.97
+        self.default_tie_break_threshold = 0.7
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        low, high = self.ngram_range
+        for row, text in enumerate(texts):
+            for word in text.split():
+                padded = f" {word} "
+                for n in range(low, high + 1):
+                    for i in range(max(len(padded) - n + 1, 1)):
+                        vectors[row, zlib.crc32(padded[i:i + n].encode("utf-8")) % self.dim] += 1
+        np.log1p(vectors, out=vectors)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """Small CPU sentence-embedding model, loaded on first use."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        self.model_name = model_name
+        self.name = f"sentence-transformers:{model_name}"
+        self.default_threshold = 0.85
+        self.default_tie_break_threshold = 0.7
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+
+def default_embedder(model_name: str = "all-MiniLM-L6-v2"):
+    """A sentence-transformers embedder if it is installed, else hashed n-grams.
+
+    sentence-transformers is optional (it pulls in torch), so the cache works
+    without it; `model_name="hashing"` picks the n-grams explicitly.
+    """
+    if model_name and model_name != "hashing" and importlib.util.find_spec("sentence_transformers"):
+        return SentenceTransformerEmbedder(model_name)
+    return HashingEmbedder()
+
+
+class SemanticCache:
+    """Final outputs of past queries, found by embedding similarity.
+
+    Vectors live in a flat float32 file that is memory-mapped for search,
+    one fixed slot per entry; metadata lives in SQLite next to it. Expired
+    and evicted entries free their slot for the next insert, so the file
+    only grows to `max_entries` rows. Lookups return the most similar entry
+    for the same preference if its cosine similarity reaches `threshold`, or
+    if it reaches the lower `tie_break_threshold` and its query has the same
+    subject and intent terms (see `same_terms`), which lets spelling variants
+    the embedder scores low still hit. Both default to the embedder's.
+    """
+
+    def __init__(self, path: str, embedder=None, threshold: float = None, tie_break_threshold: float = None,
+                 ttl: float = 24 * 3600, max_entries: int = 2000, top_k: int = 5):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold if threshold is not None else self.embedder.default_threshold
+        self.tie_break_threshold = (tie_break_threshold if tie_break_threshold is not None
+                                    else min(self.embedder.default_tie_break_threshold, self.threshold))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                slot INTEGER PRIMARY KEY,
+                terms TEXT NOT NULL,
+                preference TEXT NOT NULL,
+                query TEXT NOT NULL,
+                final_output TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_preference ON entries (preference)")
+        self._checked_embedder = False
+
+    def _check_embedder(self):
+        """Start a fresh index when the embedder (and so the vector space) or the term format changes."""
+        if self._checked_embedder:
+            return
+        index_name = f"{self.embedder.name}/terms-v{QUERY_TERMS_VERSION}"
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+        if row is None or row[0] != index_name:
+            self._conn.execute("DELETE FROM entries")
+            open(self._vectors_path, "wb").close()
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (index_name,))
+            self._matrix = None
+        self._checked_embedder = True
+
+    def _load_matrix(self):
+        """Memory-map the vector file, remapping when another writer grew it."""
+        if not os.path.exists(self._vectors_path):
+            return None
+        rows = os.path.getsize(self._vectors_path) // (self.embedder.dim * 4)
+        if rows == 0:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.embedder.dim))
+        return self._matrix
+
+    def search(self, query: str, preference: str, k: int = None) -> list[dict]:
+        """Top-k entries for `preference` that pass the similarity thresholds."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        vector = self.embedder.embed([terms])[0]
+        now = time.time()
+        with self._lock:
+            self._check_embedder()
+            rows = self._conn.execute(
+                "SELECT slot, query, final_output, terms FROM entries WHERE preference = ? AND created_at >= ?",
+                (preference, now - self.ttl),
+            ).fetchall()
+            matrix = self._load_matrix()
+            if not rows or matrix is None:
+                return []
+            slots = np.array([row[0] for row in rows])
+            similarities = matrix[slots] @ vector
+            order = [i for i in np.argsort(-similarities) if similarities[i] >= self.threshold or (
+                similarities[i] >= self.tie_break_threshold and same_terms(terms, rows[i][3]))][:k or self.top_k]
+            hits = [
+                {"query": rows[i][1], "final_output": rows[i][2], "similarity": float(similarities[i])}
+                for i in order
+            ]
+            if hits:
+                self._conn.execute("UPDATE entries SET accessed_at = ? WHERE slot = ?", (now, int(slots[order[0]])))
+        return hits
+
+    def get(self, query: str, preference: str):
+        """Return the closest cached answer for `query`, or None on a miss."""
+        hits = self.search(query, preference, k=1)
+        return hits[0] if hits else None
+
+    def put(self, query: str, preference: str, final_output: str):
+        """Index `final_output` for `query`, evicting expired / least recently used entries."""
+        terms = query_terms(query)
+        if not terms:
+            return
+        vector = self.embedder.embed([terms])[0].astype(np.float32)
+        now = time.time()
+        with self._lock:
+            self._check_embedder()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+                self._conn.execute("DELETE FROM entries WHERE terms = ? AND preference = ?", (terms, preference))
+                self._conn.execute(
+                    """DELETE FROM entries WHERE slot IN (
+                        SELECT slot FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (max(self.max_entries - 1, 0),),
+                )
+                used = {row[0] for row in self._conn.execute("SELECT slot FROM entries")}
+                rows = os.path.getsize(self._vectors_path) // (self.embedder.dim * 4)
+                slot = next((i for i in range(rows) if i not in used), rows)
+                with open(self._vectors_path, "r+b") as f:
+                    f.seek(slot * self.embedder.dim * 4)
+                    f.write(vector.tobytes())
+                self._conn.execute(
+                    """INSERT INTO entries (slot, terms, preference, query, final_output, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (slot, terms, preference, query, final_output, now, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._matrix = None
+            self._conn.close()
@@ -0,0 +1,82 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Streaming event handlers: act on each runner event as it arrives and keep
+only what the caller needs, instead of buffering the whole event list
+"""
+
+import asyncio
+from typing import AsyncIterator, Callable, Optional
+
+from google.adk.events import Event
+from google.adk.flows.llm_flows.functions import REQUEST_CONFIRMATION_FUNCTION_CALL_NAME
+
+
+def approval_request(event: Event) -> Optional[dict]:
+    """`{"approval_id", "invocation_id", "hint"}` if the event pauses the run for user input."""
+    for call in event.get_function_calls():
+        if call.name == REQUEST_CONFIRMATION_FUNCTION_CALL_NAME:
+            confirmation = (call.args or {}).get("toolConfirmation") or {}
+            return {
+                "approval_id": call.id,
+                "invocation_id": event.invocation_id,
+                "hint": confirmation.get("hint"),
+            }
+    return None
+
+
+class ApprovalDetector:
+    """Remembers the first approval request; `found` is set as soon as it arrives."""
+
+    def __init__(self):
+        self.approval = None
+        self.found = asyncio.Event()
+
+    def __call__(self, event: Event):
+        if self.approval is None:
+            self.approval = approval_request(event)
+            if self.approval:
+                self.found.set()
+
+
+class ProgressReporter:
+    """Calls `report(agent_name)` for the first event of each agent."""
+
+    def __init__(self, report: Callable[[str], None]):
+        self.report = report
+        self._seen = set()
+
+    def __call__(self, event: Event):
+        if event.author != "user" and event.author not in self._seen:
+            self._seen.add(event.author)
+            self.report(event.author)
+
+
+class StateCapture:
+    """Keeps the latest value of selected state keys from each event's state delta."""
+
+    def __init__(self, *keys: str):
+        self.keys = keys
+        self.state = {}
+
+    def __call__(self, event: Event):
+        delta = event.actions.state_delta
+        for key in self.keys:
+            if key in delta:
+                self.state[key] = delta[key]
+
+    def get(self, key: str, default=None):
+        return self.state.get(key, default)
+
+
+async def process_events(events: AsyncIterator[Event], *handlers: Callable[[Event], None]) -> int:
+    """Feed each event to every handler as it arrives; returns the number of events.
+
+    No event is kept once the handlers have seen it, so memory stays flat
+    however long the run is.
+    """
+    count = 0
+    async for event in events:
+        count += 1
+        for handler in handlers:
+            handler(event)
+    return count
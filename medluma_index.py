@@ -0,0 +1,298 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Local index of BioMCP snapshots (trials, articles, variants) per disease or
+gene, searched with SQLite FTS5 before falling back to BioMCP
+
+Usage:
+    python medluma_index.py ingest "gardner syndrome" [--kinds trials articles] [--gene APC ...]
+    python medluma_index.py refresh [--limit 50]
+    python medluma_index.py watch [--interval 3600]
+    python medluma_index.py stats
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from google.adk.tools.function_tool import FunctionTool
+
+from medluma_cache import normalize_query
+from medluma_mcp import BioMcpPool, find_biomcp
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_FILE = os.path.join(".medluma", "bio_index.sqlite3")
+
+# Snapshot kind -> (BioMCP tool, arguments for a disease or gene)
+INGEST_PLAN = {
+    "trials": ("trial_searcher", lambda subject: {"conditions": [subject]}),
+    "articles": ("article_searcher", lambda subject: {"diseases": [subject]}),
+    "variants": ("variant_searcher", lambda subject: {"gene": subject.upper()}),
+}
+
+
+def split_items(text: str) -> list[str]:
+    """Split a BioMCP markdown listing ("1. ...", "2. ...") into one item per record."""
+    items, current = [], []
+    for line in (text or "").splitlines():
+        if re.match(r"\s*\d+\.\s", line) and current:
+            items.append("\n".join(current).strip())
+            current = []
+        if line.strip() and not line.lstrip().startswith("#"):
+            current.append(line)
+    if current:
+        items.append("\n".join(current).strip())
+    return [item for item in items if item]
+
+
+def _match_expression(query: str) -> str:
+    """FTS5 expression matching any word of `query` (quoted, so no operators leak in)."""
+    return " OR ".join(f'"{word}"' for word in normalize_query(query).split())
+
+
+class BioIndex:
+    """SQLite snapshots of BioMCP results, one per (kind, subject).
+
+    Each snapshot's records are stored as separate rows of an FTS5 table so a
+    lookup returns only the records matching the question. Snapshots older
+    than `max_age` seconds are stale: lookups refetch them and `stale()`
+    lists them for the background refresh, most requested first.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_FILE, max_age: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS snapshots (
+                kind TEXT NOT NULL,
+                subject_key TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                refreshed_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, subject_key)
+            )"""
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS items USING fts5(kind UNINDEXED, subject_key UNINDEXED, text)"
+        )
+
+    def put(self, kind: str, subject: str, text: str):
+        """Replace the snapshot of `kind` for `subject` with a fresh BioMCP result."""
+        key = normalize_query(subject)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM items WHERE kind = ? AND subject_key = ?", (kind, key))
+                self._conn.executemany(
+                    "INSERT INTO items (kind, subject_key, text) VALUES (?, ?, ?)",
+                    [(kind, key, item) for item in split_items(text)],
+                )
+                self._conn.execute(
+                    """INSERT INTO snapshots (kind, subject_key, subject, refreshed_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (kind, subject_key) DO UPDATE SET
+                        subject = excluded.subject,
+                        refreshed_at = excluded.refreshed_at""",
+                    (kind, key, subject, time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, kind: str, subject: str, query: str = ""):
+        """Return `{"items", "refreshed_at", "stale"}` for a snapshot, or None if there is none.
+
+        With a `query`, only the records matching it are returned (all of
+        them if none match).
+        """
+        key = normalize_query(subject)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT refreshed_at FROM snapshots WHERE kind = ? AND subject_key = ?", (kind, key)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE snapshots SET hits = hits + 1 WHERE kind = ? AND subject_key = ?", (kind, key)
+            )
+            items = []
+            expression = _match_expression(query)
+            if expression:
+                items = [text for (text,) in self._conn.execute(
+                    "SELECT text FROM items WHERE kind = ? AND subject_key = ? AND items MATCH ? ORDER BY rank",
+                    (kind, key, f"text : ({expression})"),
+                )]
+            if not items:
+                items = [text for (text,) in self._conn.execute(
+                    "SELECT text FROM items WHERE kind = ? AND subject_key = ? ORDER BY rowid", (kind, key)
+                )]
+        return {"items": items, "refreshed_at": row[0], "stale": time.time() - row[0] > self.max_age}
+
+    def stale(self, limit: int = 50) -> list[tuple[str, str]]:
+        """(kind, subject) of stale snapshots, most requested first."""
+        with self._lock:
+            return self._conn.execute(
+                """SELECT kind, subject FROM snapshots WHERE refreshed_at < ?
+                ORDER BY hits DESC, refreshed_at LIMIT ?""",
+                (time.time() - self.max_age, limit),
+            ).fetchall()
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT s.kind, s.subject, s.refreshed_at, s.hits, COUNT(i.rowid)
+                FROM snapshots s LEFT JOIN items i ON i.kind = s.kind AND i.subject_key = s.subject_key
+                GROUP BY s.kind, s.subject_key ORDER BY s.hits DESC"""
+            ).fetchall()
+        return [
+            {"kind": kind, "subject": subject, "age_hours": round((time.time() - refreshed_at) / 3600, 1),
+             "hits": hits, "items": items}
+            for kind, subject, refreshed_at, hits, items in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Ingest and refresh
+async def fetch_snapshot(pool: BioMcpPool, kind: str, subject: str) -> str:
+    """Run the BioMCP tool for `kind` and return its text output."""
+    tool_name, arguments = INGEST_PLAN[kind]
+    await pool.start()
+    async with pool.session() as session:
+        response = await asyncio.wait_for(session.call_tool(tool_name, arguments=arguments(subject)),
+                                          timeout=pool.timeout)
+    if response.isError:
+        raise RuntimeError(f"{tool_name} failed for {subject!r}")
+    return "\n".join(getattr(content, "text", "") for content in response.content)
+
+
+async def ingest(index: BioIndex, pool: BioMcpPool, subject: str, kinds=("trials", "articles")):
+    """Snapshot every `kind` for `subject` into the index."""
+    for kind in kinds:
+        index.put(kind, subject, await fetch_snapshot(pool, kind, subject))
+        logger.info("Indexed %s for %s", kind, subject)
+
+
+async def refresh_stale(index: BioIndex, pool: BioMcpPool, limit: int = 50) -> int:
+    """Refetch up to `limit` stale snapshots; returns how many were refreshed."""
+    refreshed = 0
+    for kind, subject in index.stale(limit):
+        try:
+            index.put(kind, subject, await fetch_snapshot(pool, kind, subject))
+            refreshed += 1
+        except Exception as e:
+            logger.warning("Could not refresh %s for %s: %s", kind, subject, e)
+    return refreshed
+
+
+async def refresh_loop(index: BioIndex, pool: BioMcpPool, interval: float = 3600, limit: int = 50):
+    """Background job: refresh stale snapshots every `interval` seconds."""
+    while True:
+        refreshed = await refresh_stale(index, pool, limit)
+        if refreshed:
+            logger.info("Refreshed %d BioMCP snapshots", refreshed)
+        await asyncio.sleep(interval)
+
+
+# Agent tool
+def bio_index_tool(index: BioIndex, pool: BioMcpPool) -> FunctionTool:
+    """Tool that answers trial, article and variant lookups from the index.
+
+    Misses and stale snapshots are fetched from BioMCP and written back; if
+    BioMCP fails, a stale snapshot is still returned.
+    """
+
+    async def lookup_biomedical_index(kind: str, subject: str, query: str = "") -> dict:
+        """Look up clinical trials, articles or genetic variants from the local BioMCP index.
+
+        Args:
+            kind: "trials", "articles" or "variants".
+            subject: The disease (for trials and articles) or gene symbol (for variants).
+            query: Optional words to narrow the records, e.g. "phase 3 recruiting".
+
+        Returns:
+            The matching records, their source and when they were last fetched.
+        """
+        if kind not in INGEST_PLAN:
+            return {"status": "error", "error_message": f"kind must be one of {sorted(INGEST_PLAN)}"}
+        snapshot = await asyncio.to_thread(index.get, kind, subject, query)
+        source = "local_index"
+        if snapshot is None or snapshot["stale"]:
+            try:
+                text = await fetch_snapshot(pool, kind, subject)
+            except Exception as e:
+                if snapshot is None:
+                    return {"status": "error", "error_message": f"BioMCP lookup failed: {e}"}
+                logger.warning("BioMCP refetch failed for %s %s; serving stale snapshot: %s", kind, subject, e)
+            else:
+                await asyncio.to_thread(index.put, kind, subject, text)
+                snapshot = await asyncio.to_thread(index.get, kind, subject, query)
+                source = "biomcp"
+        return {
+            "status": "success",
+            "source": source,
+            "fetched_at": time.strftime("%Y-%m-%d", time.localtime(snapshot["refreshed_at"])),
+            "records": snapshot["items"],
+        }
+
+    return FunctionTool(lookup_biomedical_index)
+
+
+async def _main(args):
+    index = BioIndex(args.index, max_age=args.max_age)
+    if args.command == "stats":
+        for row in index.stats():
+            print(json.dumps(row))
+        return
+
+    biomcp_path = find_biomcp()
+    if not biomcp_path:
+        raise SystemExit("biomcp not found - run: pip install biomcp-python")
+    pool = BioMcpPool(command=biomcp_path, size=1)
+    try:
+        if args.command == "ingest":
+            await ingest(index, pool, args.disease, args.kinds)
+            for gene in args.gene:
+                await ingest(index, pool, gene, ["variants"])
+        elif args.command == "refresh":
+            print(f"Refreshed {await refresh_stale(index, pool, args.limit)} snapshots")
+        else:
+            await refresh_loop(index, pool, args.interval, args.limit)
+    finally:
+        await pool.close()
+        index.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Local BioMCP snapshot index.")
+    parser.add_argument("--index", default=os.environ.get("MEDLUMA_BIO_INDEX", DEFAULT_INDEX_FILE))
+    parser.add_argument("--max-age", type=float,
+                        default=float(os.environ.get("MEDLUMA_BIO_INDEX_MAX_AGE", str(7 * 24 * 3600))),
+                        help="Seconds before a snapshot is stale")
+    commands = parser.add_subparsers(dest="command", required=True)
+    # Variants are looked up by gene, so they are ingested with --gene rather than --kinds
+    ingest_parser = commands.add_parser("ingest", help="Snapshot BioMCP results for a disease")
+    ingest_parser.add_argument("disease")
+    ingest_parser.add_argument("--kinds", nargs="+", default=["trials", "articles"], choices=["trials", "articles"])
+    ingest_parser.add_argument("--gene", nargs="*", default=[], help="Genes whose variants to snapshot")
+    for name, help_text in (("refresh", "Refresh stale snapshots once"), ("watch", "Refresh stale snapshots periodically")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--limit", type=int, default=50, help="Snapshots per refresh")
+        command.add_argument("--interval", type=float, default=3600, help="Seconds between refreshes (watch)")
+    commands.add_parser("stats", help="List indexed snapshots")
+    asyncio.run(_main(parser.parse_args()))
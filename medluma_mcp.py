@@ -0,0 +1,389 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Pooled, pre-warmed BioMCP server processes shared across Runner sessions
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams, retry_on_closed_resource
+from google.adk.tools.mcp_tool.mcp_tool import McpTool
+from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
+
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def find_biomcp():
+    """Locate the biomcp executable, or return None (cached per process)."""
+    biomcp_path = shutil.which("biomcp")
+    if biomcp_path:
+        return biomcp_path
+
+    # Build a list of possible paths to search for the executable
+    if sys.platform == "win32":
+        # On Windows, pip installs executables in the 'Scripts' directory
+        possible_paths = [
+            os.path.join(sys.prefix, "Scripts", "biomcp.exe"),
+            os.path.join(os.path.dirname(sys.executable), "biomcp.exe"),
+            os.path.expanduser("~\\.local\\bin\\biomcp.exe")
+        ]
+    else:
+        # On Linux and macOS, it's usually in the 'bin' directory
+        possible_paths = [
+            os.path.join(sys.prefix, "bin", "biomcp"),
+            os.path.join(os.path.dirname(sys.executable), "biomcp"),
+            os.path.expanduser("~/.local/bin/biomcp")
+        ]
+
+    for path in possible_paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class _BioMcpServer:
+    """One `biomcp run` process and its MCP session.
+
+    The stdio client's anyio cancel scopes must be exited by the task that
+    entered them, so a long-lived owner task opens the session, waits to be
+    stopped and closes it; `connect()` and `stop()` only start and signal
+    that task, from whichever task calls them.
+    """
+
+    def __init__(self, connection_params: StdioConnectionParams):
+        self.connection_params = connection_params
+        self.session = None
+        self._owner = None
+        self._stop = None
+        self._lock = asyncio.Lock()
+
+    def _connected(self) -> bool:
+        session = self.session
+        return (session is not None and not self._owner.done()
+                and not (session._read_stream._closed or session._write_stream._closed))
+
+    async def connect(self) -> ClientSession:
+        """Return the live session, (re)starting the server if it is down."""
+        async with self._lock:
+            if not self._connected():
+                await self._shutdown()
+                self._stop = asyncio.Event()
+                ready = asyncio.get_running_loop().create_future()
+                self._owner = asyncio.create_task(self._own(ready, self._stop))
+                self.session = await ready
+            return self.session
+
+    async def stop(self):
+        async with self._lock:
+            await self._shutdown()
+
+    async def _shutdown(self):
+        if self._owner is None:
+            return
+        self._stop.set()
+        await self._owner
+        self._owner = self.session = None
+
+    async def _own(self, ready: asyncio.Future, stop: asyncio.Event):
+        timeout = self.connection_params.timeout
+        try:
+            async with stdio_client(self.connection_params.server_params) as (read, write):
+                async with ClientSession(read, write, read_timeout_seconds=timedelta(seconds=timeout)) as session:
+                    async with asyncio.timeout(timeout):
+                        await session.initialize()
+                    if not ready.done():
+                        ready.set_result(session)
+                    await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(ConnectionError(f"Failed to start BioMCP server: {e}"))
+            else:
+                logger.warning("BioMCP server session ended with an error: %s", e)
+
+
+class BioMcpPool:
+    """A fixed set of long-lived `biomcp run` servers.
+
+    Servers are started once (`start()`), pinged every `health_interval`
+    seconds and restarted when they crash or stop answering. At most
+    `max_concurrency` tool calls run at once across all servers; each call
+    goes to the least busy server. One pool is meant to be shared by every
+    Runner session in the process (and event loop).
+
+    Without a `command`, the biomcp executable is located when the pool
+    starts, so building the pipeline does not need it installed.
+    """
+
+    def __init__(
+        self,
+        command: str = None,
+        args: list[str] = None,
+        size: int = 2,
+        max_concurrency: int = 8,
+        log_level: str = "warning",
+        timeout: float = 120,
+        health_interval: float = 30,
+    ):
+        self.connection_params = StdioConnectionParams(
+            server_params=StdioServerParameters(
+                command=command or "biomcp",
+                args=args if args is not None else ["run"],
+                env={"MCP_LOG_LEVEL": log_level}
+            ),
+            timeout=timeout,
+        )
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self._locate_command = command is None
+        self._servers = [_BioMcpServer(self.connection_params) for _ in range(size)]
+        self._in_flight = [0] * size
+        self._next = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._start_lock = asyncio.Lock()
+        self._health_task = None
+
+    async def start(self):
+        """Spawn and initialize every server, then begin health checks."""
+        async with self._start_lock:
+            if self._health_task is not None:
+                return
+            if self._locate_command:
+                biomcp_path = find_biomcp()
+                if not biomcp_path:
+                    raise RuntimeError("biomcp not found - run: pip install biomcp-python")
+                self.connection_params.server_params.command = biomcp_path
+                self._locate_command = False
+            await asyncio.gather(*(server.connect() for server in self._servers))
+            self._health_task = asyncio.create_task(self._health_loop())
+            logger.info("BioMCP pool warmed up with %d servers", len(self._servers))
+
+    async def create_session(self, headers=None):
+        """Return a connected session (MCPSessionManager-compatible)."""
+        server = self._servers[self._next % len(self._servers)]
+        self._next += 1
+        return await server.connect()
+
+    @asynccontextmanager
+    async def session(self):
+        """Hold one concurrency slot on the least busy server."""
+        async with self._semaphore:
+            index = min(range(len(self._servers)), key=self._in_flight.__getitem__)
+            self._in_flight[index] += 1
+            try:
+                yield await self._servers[index].connect()
+            finally:
+                self._in_flight[index] -= 1
+
+    async def health_check(self):
+        """Ping every server and restart any that do not answer."""
+        for index, server in enumerate(self._servers):
+            try:
+                session = await server.connect()
+                await asyncio.wait_for(session.send_ping(), timeout=10)
+            except Exception as e:
+                logger.warning("BioMCP server %d unhealthy (%s); restarting", index, e)
+                await server.stop()
+                try:
+                    await server.connect()
+                except Exception as restart_error:
+                    logger.error("BioMCP server %d failed to restart: %s", index, restart_error)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.health_check()
+
+    async def close(self):
+        """Stop health checks and shut every server down."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(server.stop() for server in self._servers))
+
+
+def _canonical(value):
+    """Normalize tool arguments so equivalent calls share a cache key."""
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items() if item not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        items = [_canonical(item) for item in value]
+        # Lists of plain values (conditions, genes, keywords) are sets to the server
+        if all(isinstance(item, (str, int, float, bool)) for item in items):
+            return sorted(set(items), key=lambda item: (str(type(item)), item))
+        return items
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    return value
+
+
+def tool_call_key(tool_name: str, args: dict) -> str:
+    return tool_name + ":" + json.dumps(_canonical(args or {}), sort_keys=True, separators=(",", ":"))
+
+
+# Trial recruiting status changes faster than literature or variant annotations
+DEFAULT_TOOL_TTLS = {
+    "trial_searcher": 6 * 3600,
+    "trial_getter": 6 * 3600,
+    "article_searcher": 24 * 3600,
+    "article_getter": 7 * 24 * 3600,
+    "variant_searcher": 7 * 24 * 3600,
+    "variant_getter": 7 * 24 * 3600,
+}
+
+
+class ToolCallCache:
+    """Memoized MCP tool results shared by every session in the process.
+
+    Calls are keyed by tool name plus canonicalized arguments. Concurrent
+    identical calls wait on the first one instead of reaching the server
+    (single-flight). Successful results are kept zlib-compressed for the
+    tool's TTL (`ttls`, else `default_ttl`) in an LRU bounded to `max_bytes`.
+    """
+
+    def __init__(self, ttls: dict = None, default_ttl: float = 3600, max_bytes: int = 64 * 1024 * 1024):
+        self.ttls = dict(DEFAULT_TOOL_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (expires_at, compressed result)
+        self._bytes = 0
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, blob = entry
+        if time.monotonic() > expires_at:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return json.loads(zlib.decompress(blob))
+
+    def _drop(self, key: str):
+        _, blob = self._entries.pop(key)
+        self._bytes -= len(blob)
+
+    def _put(self, key: str, ttl: float, result: dict):
+        blob = zlib.compress(json.dumps(result, separators=(",", ":")).encode("utf-8"))
+        if ttl <= 0 or len(blob) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, blob)
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    async def call(self, tool_name: str, args: dict, fetch):
+        """Return the cached result for this call, or await `fetch()` once for all callers."""
+        key = tool_call_key(tool_name, args)
+        result = self._get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # A task of its own, so a cancelled caller does not cancel the call for the others
+            task = asyncio.ensure_future(self._fetch(key, tool_name, fetch))
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, tool_name: str, fetch):
+        try:
+            result = await fetch()
+        finally:
+            self._in_flight.pop(key, None)
+        if not result.get("isError"):
+            self._put(key, self.ttls.get(tool_name, self.default_ttl), result)
+        return result
+
+    def clear(self):
+        """Drop every cached result and reset the counters."""
+        self._entries.clear()
+        self._bytes = 0
+        self.hits = self.misses = self.coalesced = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+
+class PooledMcpTool(McpTool):
+    """McpTool that runs each call on a BioMcpPool slot, memoized by an optional ToolCallCache."""
+
+    def __init__(self, *, pool: BioMcpPool, cache: ToolCallCache = None, **kwargs):
+        super().__init__(mcp_session_manager=pool, **kwargs)
+        self._pool = pool
+        self._cache = cache
+
+    async def _run_async_impl(self, *, args, tool_context, credential):
+        if self._cache is None:
+            return await self._call(args)
+        return await self._cache.call(self._mcp_tool.name, args, lambda: self._call(args))
+
+    @retry_on_closed_resource
+    async def _call(self, args):
+        async with self._pool.session() as session:
+            response = await session.call_tool(self._mcp_tool.name, arguments=args)
+        return response.model_dump(exclude_none=True, mode="json")
+
+
+class PooledMcpToolset(McpToolset):
+    """McpToolset backed by a shared BioMcpPool.
+
+    The tool list is fetched once and reused, and `close()` leaves the pool
+    running because it outlives any single Runner; call `pool.close()` on
+    shutdown instead. Pass a ToolCallCache to memoize tool calls.
+    """
+
+    def __init__(self, *, pool: BioMcpPool, cache: ToolCallCache = None, **kwargs):
+        super().__init__(connection_params=pool.connection_params, **kwargs)
+        self._pool = pool
+        self.cache = cache
+        self._mcp_session_manager = pool
+        self._mcp_tools = None
+
+    async def get_tools(self, readonly_context=None):
+        if self._mcp_tools is None:
+            await self._pool.start()
+            session = await self._pool.create_session()
+            tools_response = await asyncio.wait_for(session.list_tools(), timeout=self._pool.timeout)
+            self._mcp_tools = tools_response.tools
+
+        tools = []
+        for mcp_tool in self._mcp_tools:
+            tool = PooledMcpTool(pool=self._pool, cache=self.cache, mcp_tool=mcp_tool)
+            if self._is_tool_selected(tool, readonly_context):
+                tools.append(tool)
+        return tools
+
+    async def close(self):
+        return None
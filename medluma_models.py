@@ -0,0 +1,87 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Per-agent model routing: each agent runs on the cheapest tier that meets its
+quality bar, overridable without code changes
+
+MEDLUMA_MODEL_ROUTES takes "AgentName=tier-or-model" pairs separated by commas
+(e.g. "CriticAgent=flash,AggregatorAgent=gemini-2.5-pro") or the path of a
+JSON file mapping agent names to tiers or model names.
+"""
+
+import json
+import os
+
+from medluma_ratelimit import RateLimitedGemini
+
+
+MODEL_TIERS = {
+    "lite": "gemini-2.5-flash-lite",
+    "flash": "gemini-2.5-flash",
+    "pro": "gemini-2.5-pro",
+}
+
+# USD per million (input, output) tokens
+MODEL_PRICES = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+# Classification, critique and summarizing hold up on the lite tier; research
+# (tool use) and the writing the user reads stay on flash.
+# Compare tiers with benchmarks/eval_model_tiers.py before changing these.
+DEFAULT_MODEL_ROUTES = {
+    "PreferenceFallbackAgent": "lite",
+    "AggregatorAgent": "lite",
+    "CriticAgent": "lite",
+    "BioResearcher": "flash",
+    "HealthResearcher": "flash",
+    "InitialScienceWriterAgent": "flash",
+    "RefinerAgent": "flash",
+    "FinalOutputAgent": "flash",
+}
+
+
+def model_name(tier_or_model: str) -> str:
+    return MODEL_TIERS.get(tier_or_model, tier_or_model)
+
+
+def load_routes(spec: str) -> dict:
+    """Parse MEDLUMA_MODEL_ROUTES: a JSON file path or "Agent=tier,..." pairs."""
+    spec = (spec or "").strip()
+    if not spec:
+        return {}
+    if os.path.exists(spec):
+        with open(spec, encoding="utf-8") as f:
+            return dict(json.load(f))
+    routes = {}
+    for pair in spec.split(","):
+        agent, sep, tier = pair.partition("=")
+        if not sep or not agent.strip() or not tier.strip():
+            raise ValueError(f"Invalid model route {pair!r}; expected AgentName=tier")
+        routes[agent.strip()] = tier.strip()
+    return routes
+
+
+class ModelRouter:
+    """Builds each agent's model from a routing table (agent name -> tier or model)."""
+
+    def __init__(self, routes: dict = None, default: str = "flash"):
+        self.routes = dict(DEFAULT_MODEL_ROUTES if routes is None else routes)
+        self.default = default
+
+    @classmethod
+    def from_env(cls, default: str = "flash") -> "ModelRouter":
+        return cls({**DEFAULT_MODEL_ROUTES, **load_routes(os.environ.get("MEDLUMA_MODEL_ROUTES", ""))}, default)
+
+    def model_for(self, agent_name: str) -> str:
+        return model_name(self.routes.get(agent_name, self.default))
+
+    def __call__(self, agent_name: str) -> RateLimitedGemini:
+        return RateLimitedGemini(model=self.model_for(agent_name))
+
+
+def cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """USD cost of a model's token usage (0 for models without a known price)."""
+    input_price, output_price = MODEL_PRICES.get(model_name(model), (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
@@ -0,0 +1,403 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Agent pipeline for the web app; imported on first use through medluma_app.py
+"""
+
+import os
+from google.genai import types
+from google.adk.agents import Agent, SequentialAgent, ParallelAgent, LoopAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.apps.app import App, ResumabilityConfig
+from google.adk.tools.google_search_tool import google_search
+
+from medluma_agents import (
+    CoalescedAgent,
+    CritiqueGate,
+    PreferenceAgent,
+    PreferenceBranch,
+    TimeboxedAgent,
+    answer_flight_key,
+    normalize_preference,
+    query_flight_key,
+    remember_user_query,
+    requested_preference,
+    use_requested_preference,
+)
+from medluma_cache import ResearchCache, SemanticCache, default_embedder
+from medluma_index import DEFAULT_INDEX_FILE, BioIndex, bio_index_tool
+from medluma_mcp import BioMcpPool, PooledMcpToolset, ToolCallCache
+from medluma_models import ModelRouter
+from medluma_prompts import PromptBudget
+from medluma_records import (
+    BIO_RESEARCH_FORMAT,
+    HEALTH_RESEARCH_FORMAT,
+    aggregator_instruction,
+    final_output_instruction,
+    structure_bio_research,
+    structure_health_research,
+)
+from medluma_refresh import DEFAULT_OUTPUT_STORE, OutputStore, reuse_unchanged_output, store_output
+from medluma_tracing import DEFAULT_TRACE_FILE, TracingPlugin
+
+
+# Each agent's model comes from the routing table (MEDLUMA_MODEL_ROUTES overrides it)
+route_model = ModelRouter.from_env()
+
+# Token budgets for the state interpolated into each prompt (MEDLUMA_PROMPT_BUDGETS overrides them)
+prompt_budget = PromptBudget.from_env()
+
+# Per-branch deadlines for the concurrent research stage (seconds)
+BIO_RESEARCH_TIMEOUT = float(os.environ.get("MEDLUMA_BIO_RESEARCH_TIMEOUT", "180"))
+HEALTH_RESEARCH_TIMEOUT = float(os.environ.get("MEDLUMA_HEALTH_RESEARCH_TIMEOUT", "90"))
+
+# How long a session waits for an identical in-flight query before running
+# it itself (seconds); 0 turns request coalescing off
+COALESCE_TIMEOUT = float(os.environ.get("MEDLUMA_COALESCE_TIMEOUT", "300"))
+
+# Critique score (out of 10) that approves a draft without refining it
+CRITIQUE_SCORE_THRESHOLD = float(os.environ.get("MEDLUMA_CRITIQUE_SCORE_THRESHOLD", "8"))
+
+
+# Research cache: research for the same disease barely changes within a day
+research_cache = ResearchCache(
+    path=os.environ.get("MEDLUMA_RESEARCH_CACHE", os.path.join(".medluma", "research_cache.sqlite3")),
+    ttl=float(os.environ.get("MEDLUMA_RESEARCH_CACHE_TTL", str(24 * 3600))),
+    max_entries=int(os.environ.get("MEDLUMA_RESEARCH_CACHE_SIZE", "500")),
+)
+
+# Semantic cache: near-duplicate queries ("gardener syndrome treatments",
+# "Gardner's syndrome new therapies") reuse a stored final output. Embeds with
+# sentence-transformers when it is installed, else with hashed character n-grams
+semantic_threshold = os.environ.get("MEDLUMA_SEMANTIC_CACHE_THRESHOLD")
+semantic_cache = SemanticCache(
+    path=os.environ.get("MEDLUMA_SEMANTIC_CACHE", os.path.join(".medluma", "semantic_cache")),
+    embedder=default_embedder(os.environ.get("MEDLUMA_EMBEDDING_MODEL", "all-MiniLM-L6-v2")),
+    threshold=float(semantic_threshold) if semantic_threshold else None,
+    ttl=float(os.environ.get("MEDLUMA_SEMANTIC_CACHE_TTL", str(24 * 3600))),
+    max_entries=int(os.environ.get("MEDLUMA_SEMANTIC_CACHE_SIZE", "2000")),
+)
+
+# Last final output per query and preference with the fingerprint of its
+# research: a rerun whose research is unchanged reuses it (set
+# MEDLUMA_OUTPUT_STORE="" to always regenerate)
+output_store_path = os.environ.get("MEDLUMA_OUTPUT_STORE", DEFAULT_OUTPUT_STORE)
+output_store = OutputStore(output_store_path) if output_store_path else None
+
+
+# Configure BioMCP MCP tool: a shared pool of long-lived servers, warmed up on
+# first use (or explicitly with `await bio_mcp_pool.start()` at startup); the
+# biomcp executable is located when the pool starts
+bio_mcp_pool = BioMcpPool(
+    size=int(os.environ.get("MEDLUMA_BIOMCP_POOL_SIZE", "2")),
+    max_concurrency=int(os.environ.get("MEDLUMA_BIOMCP_MAX_CONCURRENCY", "8")),
+    log_level=os.environ.get("MEDLUMA_BIOMCP_LOG_LEVEL", "warning"),
+    timeout=120,
+    health_interval=float(os.environ.get("MEDLUMA_BIOMCP_HEALTH_INTERVAL", "30")),
+)
+# Identical BioMCP calls (within a run or across sessions) share one result;
+# see tool_call_cache.stats() for the hit rate
+tool_call_cache = ToolCallCache(
+    default_ttl=float(os.environ.get("MEDLUMA_TOOL_CACHE_TTL", "3600")),
+    max_bytes=int(float(os.environ.get("MEDLUMA_TOOL_CACHE_MB", "64")) * 1024 * 1024),
+)
+mcp_bio_server = PooledMcpToolset(pool=bio_mcp_pool, cache=tool_call_cache)
+
+# Local index of BioMCP snapshots, answered before BioMCP itself; fill it with
+# `python medluma_index.py ingest "<disease>"` and keep it fresh with `watch`
+bio_index = BioIndex(
+    path=os.environ.get("MEDLUMA_BIO_INDEX", DEFAULT_INDEX_FILE),
+    max_age=float(os.environ.get("MEDLUMA_BIO_INDEX_MAX_AGE", str(7 * 24 * 3600))),
+)
+bio_index_lookup = bio_index_tool(bio_index, bio_mcp_pool)
+
+
+# Agent callbacks
+def load_cached_research(callback_context: CallbackContext):
+    """Skip the researchers when fresh research for this query is cached."""
+    cached = research_cache.get(callback_context.state.get("user_query", ""))
+    if not cached:
+        return None
+    callback_context.state["bio_research"] = cached["bio_research"]
+    callback_context.state["health_research"] = cached["health_research"]
+    return types.Content(role="model", parts=[types.Part(text="Using cached research for this query.")])
+
+
+def store_research(callback_context: CallbackContext):
+    """Cache research unless a branch fell back to a partial result."""
+    state = callback_context.state
+    if state.get("bio_research_status") or state.get("health_research_status"):
+        return None
+    if "bio_research" in state and "health_research" in state:
+        research_cache.put(state.get("user_query", ""), state["bio_research"], state["health_research"])
+    return None
+
+
+def _answer_from_cache(callback_context: CallbackContext, preference: str):
+    hit = semantic_cache.get(callback_context.state.get("user_query", ""), preference)
+    if not hit:
+        return None
+    state = callback_context.state
+    state["user_preference"] = preference
+    state["final_output"] = hit["final_output"]
+    state["final_output_status"] = "cached"
+    return types.Content(role="model", parts=[types.Part(text=hit["final_output"])])
+
+
+def load_cached_answer_for_request(callback_context: CallbackContext):
+    """Skip the whole pipeline when the request's preference has a cached answer."""
+    preference = requested_preference(callback_context)
+    return _answer_from_cache(callback_context, preference) if preference else None
+
+
+def load_cached_answer(callback_context: CallbackContext):
+    """Skip the article and final output stages when the chosen preference has a cached answer."""
+    return _answer_from_cache(callback_context, normalize_preference(callback_context.state.get("user_preference")))
+
+
+def store_answer(callback_context: CallbackContext):
+    """Index a freshly generated final output unless it was cached or built on partial research."""
+    state = callback_context.state
+    if not state.get("final_output") or state.get("final_output_status"):
+        return None
+    if state.get("bio_research_status") or state.get("health_research_status"):
+        return None
+    semantic_cache.put(
+        state.get("user_query", ""),
+        normalize_preference(state.get("user_preference")),
+        state["final_output"],
+    )
+    return None
+
+
+# Define Agents
+
+# Preference fallback agent
+preference_fallback_agent = Agent(
+    name="PreferenceFallbackAgent",
+    model=route_model("PreferenceFallbackAgent"),
+    description="Classify an output preference reply the keyword matcher could not resolve.",
+    instruction="""The user was asked to choose 'comprehensive' (detailed summaries + references)
+    or 'simple' (article only) output. Their reply: {preference_reply}
+    Output ONLY the preference word: "comprehensive" or "simple" (default: "simple").""",
+    output_key="user_preference",
+)
+
+# Coordinator Agent: resolves the reply locally; the fallback model only sees unclear replies
+coordinator_agent = PreferenceAgent(
+    name="CoordinatorAgent",
+    description="Determine user output preference for article detail level.",
+    sub_agents=[preference_fallback_agent],
+    before_agent_callback=use_requested_preference,
+)
+
+# Biomedical researcher Agent
+bio_researcher = Agent(
+    name="BioResearcher",
+    model=route_model("BioResearcher"),
+    description="Research biomedical information using the mcp tool.",
+    instruction="""You are a biomedical researcher. Use the mcp tool to find:
+    1. current research findings,
+     2. clinical trial information including the phase the trial is at and whether it is accepting patients,  
+     3. known mutations associated with this disease,
+     4. recent advancements in treatment options,
+     5. relevant statistics such as prevalence, mortality rates, and demographic data,
+     6. any other pertinent biomedical information,
+     7. currently available therapies and their effectiveness including FDA-approved drugs (and drugs 
+     awaiting FDA approval) and emerging treatments.
+     8. genetic markers linked to the disease.
+    For trials, articles and variants, call lookup_biomedical_index first; use the other mcp tools
+    only for what it does not cover.
+    After gathering the information, record the key findings (about 200 words in total).
+    Always include references to the sources of your information.
+    """ + BIO_RESEARCH_FORMAT,
+    tools=[bio_index_lookup, mcp_bio_server],
+    output_key="bio_research",
+    after_agent_callback=structure_bio_research,
+)
+
+# Health Researcher Agent
+health_researcher = Agent(
+    name="HealthResearcher",
+    model=route_model("HealthResearcher"),
+    description="Research recent medical breakthroughs for a particular disease or research area.",
+    instruction="""Research recent medical breakthroughs for a particular disease or research area. 
+    Include 3 significant advances, their practical applications, and estimated timelines. 
+    Keep it concise (100 words). Include relevant references.
+    """ + HEALTH_RESEARCH_FORMAT,
+    tools=[google_search],
+    output_key="health_research",
+    after_agent_callback=structure_health_research,
+)
+
+# Aggregator Agent
+aggregator_agent = Agent(
+    name="AggregatorAgent",
+    model=route_model("AggregatorAgent"),
+    description="Combine biomedical and health research findings into an executive summary.",
+    # Renders only the record fields the summary needs
+    instruction=aggregator_instruction(prompt_budget),
+    output_key="executive_summary",
+)
+
+# Scientific article writer agent
+initial_science_writer_agent = Agent(
+    name="InitialScienceWriterAgent",
+    model=route_model("InitialScienceWriterAgent"),
+    description="Write a first draft scientific article based on the executive summary.",
+    instruction=prompt_budget.template("""Based on: {executive_summary}, write a first draft article (100-150 words).
+    Output only the article text."""),
+    output_key="current_science_article",
+)
+
+# Scientific and article critique agent
+critic_agent = Agent(
+    name="CriticAgent",
+    model=route_model("CriticAgent"),
+    description="Review the scientific article draft and provide feedback or approval.",
+    instruction=prompt_budget.template("""Review: {current_science_article}
+    If well-written with references: respond "APPROVED"
+    Otherwise: provide 2-3 suggestions, then a final line "SCORE: n/10"."""),
+    output_key="critique",
+)
+
+# Article refiner agent
+refiner_agent = Agent(
+    name="RefinerAgent",
+    model=route_model("RefinerAgent"),
+    description="Refine the scientific article draft based on critique feedback.",
+    instruction=prompt_budget.template("""Draft: {current_science_article}
+    Critique: {critique}
+    Rewrite the draft incorporating the feedback. Output only the article text."""),
+    output_key="current_science_article",
+)
+
+# Final output agent
+final_output_agent = Agent(
+    name="FinalOutputAgent",
+    model=route_model("FinalOutputAgent"),
+    description="Generate the final output based on user preference.",
+    # Simple output only needs the article; comprehensive gets the rendered records
+    instruction=final_output_instruction(prompt_budget),
+    output_key="final_output",
+)
+
+
+# Build Pipeline
+
+# Article refinement loop
+article_refinement_loop = LoopAgent(
+    name="ArticleRefinementLoop",
+    sub_agents=[
+        critic_agent,
+        CritiqueGate(name="CritiqueGate", score_threshold=CRITIQUE_SCORE_THRESHOLD),
+        refiner_agent,
+    ],
+    max_iterations=2,
+)
+
+# Research pipeline: both researchers write separate state keys, so they run
+# concurrently. Each branch is timeboxed and falls back to a partial result.
+research_pipeline = ParallelAgent(
+    name="ResearchPipeline",
+    sub_agents=[
+        TimeboxedAgent(
+            name="BioResearchBranch",
+            sub_agents=[bio_researcher],
+            output_key="bio_research",
+            timeout=BIO_RESEARCH_TIMEOUT,
+        ),
+        TimeboxedAgent(
+            name="HealthResearchBranch",
+            sub_agents=[health_researcher],
+            output_key="health_research",
+            timeout=HEALTH_RESEARCH_TIMEOUT,
+        ),
+    ],
+    before_agent_callback=load_cached_research,
+    after_agent_callback=store_research,
+)
+
+# Concurrent sessions asking about the same disease share one research run;
+# statuses are shared too, so a partial result stays marked as partial
+shared_research = CoalescedAgent(
+    name="SharedResearch",
+    sub_agents=[research_pipeline],
+    flight_key=query_flight_key,
+    output_keys=["bio_research", "health_research", "bio_research_status", "health_research_status"],
+    wait_timeout=COALESCE_TIMEOUT,
+)
+
+# Intake stage: research starts as soon as the query arrives while the
+# coordinator asks for the output preference. The pause only holds back the
+# stages after this one, so the user's think time overlaps the research.
+intake_stage = ParallelAgent(
+    name="IntakeStage",
+    sub_agents=[coordinator_agent, shared_research],
+)
+
+# Article pipeline: only SIMPLE output reads the article (and the executive
+# summary behind it), so COMPREHENSIVE requests skip it entirely
+article_branch = PreferenceBranch(
+    name="ArticleBranch",
+    preferences=["simple"],
+    sub_agents=[
+        SequentialAgent(
+            name="ArticlePipeline",
+            sub_agents=[
+                aggregator_agent,
+                initial_science_writer_agent,
+                article_refinement_loop,
+            ],
+        ),
+    ],
+)
+
+# Output stage: answered from the semantic cache when a near-duplicate query
+# with the same preference has been seen, or from the last run when the
+# research fingerprint has not changed since
+output_stage = SequentialAgent(
+    name="OutputStage",
+    sub_agents=[
+        article_branch,
+        final_output_agent,
+    ],
+    before_agent_callback=[load_cached_answer, reuse_unchanged_output(output_store)],
+)
+
+# Concurrent sessions that chose the same preference for the same query share
+# one article and final output. Each session still answers its own preference
+# pause; followers are marked "coalesced" so the answer is stored only once.
+shared_output = CoalescedAgent(
+    name="SharedOutput",
+    sub_agents=[output_stage],
+    flight_key=answer_flight_key,
+    output_keys=["final_output"],
+    follower_state={"final_output_status": "coalesced"},
+    content_key="final_output",
+    wait_timeout=COALESCE_TIMEOUT,
+)
+
+# Root Agent
+root_agent = SequentialAgent(
+    name="MedlumaRootAgent",
+    sub_agents=[
+        intake_stage,
+        shared_output,
+    ],
+    before_agent_callback=[remember_user_query, load_cached_answer_for_request],
+    after_agent_callback=[store_answer, store_output(output_store)],
+)
+
+
+# Per-agent latency/token tracing (set MEDLUMA_TRACE_FILE="" to disable)
+trace_file = os.environ.get("MEDLUMA_TRACE_FILE", DEFAULT_TRACE_FILE)
+plugins = [TracingPlugin(path=trace_file)] if trace_file else []
+
+# Create the App
+app = App(
+    name="medluma",
+    root_agent=root_agent,
+    plugins=plugins,
+    resumability_config=ResumabilityConfig(is_resumable=True),
+)
+
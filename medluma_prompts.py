@@ -0,0 +1,197 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Prompt budgets: the state values interpolated into each agent's instruction
+are measured before the model call and compacted to a per-agent token budget
+
+MEDLUMA_PROMPT_BUDGETS takes "AgentName=tokens" pairs separated by commas
+(e.g. "FinalOutputAgent=4000,AggregatorAgent=1500") or the path of a JSON
+file mapping agent names to token budgets.
+"""
+
+import json
+import logging
+import os
+import re
+from collections import Counter
+
+from google.adk.agents.readonly_context import ReadonlyContext
+
+
+logger = logging.getLogger(__name__)
+
+# Tokens available to an agent's interpolated state values (the fixed
+# instruction text is not counted). Research is about 200 words per report,
+# so only verbose BioMCP output or free-text fallbacks reach these.
+DEFAULT_PROMPT_BUDGETS = {
+    "AggregatorAgent": 2000,
+    "FinalOutputAgent": 2500,
+    "InitialScienceWriterAgent": 1000,
+    "CriticAgent": 1000,
+    "RefinerAgent": 1500,
+}
+DEFAULT_PROMPT_BUDGET = 2000
+
+# {key} or {key?} (optional), as in ADK instruction templates
+_PLACEHOLDER = re.compile(r"\{(\w+)(\??)\}")
+# Sentences, or the items of a "Label: a; b; c" line
+_UNIT_SPLIT = re.compile(r"(?<=[.!?;])\s+")
+# Identifiers that mark a reference: URLs, DOIs, PMIDs and trial ids
+_REFERENCE_ID = re.compile(r"https?://\S+|\b10\.\d{4,}/\S+|\bPMID:?\s*\d+|\bNCT\d{8}\b", re.IGNORECASE)
+_STOPWORDS = frozenset(
+    "the and for with that this from are was were has have been its their which into also than more "
+    "such these those may can not but all any other about over per".split()
+)
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (4 characters per token), as in medluma_ratelimit.estimate_tokens."""
+    return (len(text or "") + 3) // 4
+
+
+def _words(text: str) -> list[str]:
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 2 and word not in _STOPWORDS]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    limit = max(0, max_tokens * 4 - 2)
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    if " " in cut:
+        cut = cut.rsplit(None, 1)[0]
+    return cut + " …"
+
+
+def compact(text: str, max_tokens: int) -> str:
+    """Extractive compaction of `text` to about `max_tokens`.
+
+    The text is split into sentences (and the items of "Label: a; b" lines).
+    Repeated sentences and references already cited are dropped, then the
+    first sentence of each line (its label, heading or lead) and then the
+    sentences sharing the most vocabulary with the rest of the text are kept,
+    in their original order.
+    """
+    text = str(text or "")
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    units = []   # (line index, unit index, text)
+    seen_text, seen_references = set(), set()
+    for line_index, line in enumerate(text.splitlines()):
+        for unit_index, unit in enumerate(_UNIT_SPLIT.split(line.strip())):
+            normalized = " ".join(_words(unit))
+            references = {ref.lower().rstrip(").,;") for ref in _REFERENCE_ID.findall(unit)}
+            if not unit or (normalized and normalized in seen_text) or (references and references <= seen_references):
+                continue
+            seen_text.add(normalized)
+            seen_references |= references
+            units.append((line_index, unit_index, unit))
+
+    frequency = Counter(word for *_, unit in units for word in _words(unit))
+
+    def rank(entry):
+        line_index, unit_index, unit = entry
+        words = set(_words(unit))
+        return unit_index == 0, sum(frequency[word] for word in words) / (1 + len(words))
+
+    kept, used = set(), 0
+    for entry in sorted(units, key=rank, reverse=True):
+        cost = count_tokens(entry[2]) + 1
+        if used + cost <= max_tokens:
+            kept.add(entry)
+            used += cost
+    if not kept:
+        return _truncate(text, max_tokens)
+
+    lines = {}
+    for line_index, unit_index, unit in sorted(kept):
+        lines.setdefault(line_index, []).append(unit)
+    return "\n".join(" ".join(parts) for parts in lines.values())
+
+
+def _allocate(sizes: dict, budget: int) -> dict:
+    """Split `budget` across values: small ones keep their size, large ones share the rest equally."""
+    shares, remaining = {}, budget
+    pending = sorted(sizes, key=sizes.get)
+    while pending:
+        key = pending.pop(0)
+        shares[key] = min(sizes[key], remaining // (len(pending) + 1))
+        remaining -= shares[key]
+    return shares
+
+
+def _budget(agent: str, tokens) -> int:
+    """A positive whole number of tokens (int or digit string)."""
+    if isinstance(tokens, str) and tokens.isdigit():
+        tokens = int(tokens)
+    if not isinstance(tokens, int) or isinstance(tokens, bool) or tokens <= 0:
+        raise ValueError(f"Invalid prompt budget {tokens!r} for {agent!r}; expected a positive number of tokens")
+    return tokens
+
+
+def load_budgets(spec: str) -> dict:
+    """Parse MEDLUMA_PROMPT_BUDGETS: a JSON file path or "Agent=tokens,..." pairs."""
+    spec = (spec or "").strip()
+    if not spec:
+        return {}
+    if os.path.exists(spec):
+        with open(spec, encoding="utf-8") as f:
+            return {agent: _budget(agent, tokens) for agent, tokens in dict(json.load(f)).items()}
+    budgets = {}
+    for pair in spec.split(","):
+        agent, sep, tokens = pair.partition("=")
+        if not sep or not agent.strip():
+            raise ValueError(f"Invalid prompt budget {pair!r}; expected AgentName=tokens")
+        budgets[agent.strip()] = _budget(agent.strip(), tokens.strip())
+    return budgets
+
+
+class PromptBudget:
+    """Per-agent token budgets (agent name -> tokens) for interpolated state values."""
+
+    def __init__(self, budgets: dict = None, default: int = DEFAULT_PROMPT_BUDGET):
+        self.budgets = dict(DEFAULT_PROMPT_BUDGETS if budgets is None else budgets)
+        self.default = default
+
+    @classmethod
+    def from_env(cls, default: int = DEFAULT_PROMPT_BUDGET) -> "PromptBudget":
+        return cls({**DEFAULT_PROMPT_BUDGETS, **load_budgets(os.environ.get("MEDLUMA_PROMPT_BUDGETS", ""))}, default)
+
+    def budget_for(self, agent_name: str) -> int:
+        return self.budgets.get(agent_name, self.default)
+
+    def fit(self, agent_name: str, values: dict) -> dict:
+        """Compact `values` (name -> text) so together they fit the agent's budget."""
+        values = {key: str(value or "") for key, value in values.items()}
+        sizes = {key: count_tokens(value) for key, value in values.items()}
+        budget = self.budget_for(agent_name)
+        if sum(sizes.values()) <= budget:
+            logger.debug("%s prompt values: %d tokens (budget %d)", agent_name, sum(sizes.values()), budget)
+            return values
+
+        shares = _allocate(sizes, budget)
+        fitted = {key: compact(value, shares[key]) for key, value in values.items()}
+        logger.info(
+            "%s prompt values compacted from %d to %d tokens (budget %d): %s",
+            agent_name, sum(sizes.values()), sum(count_tokens(value) for value in fitted.values()), budget,
+            ", ".join(f"{key} {sizes[key]}->{count_tokens(fitted[key])}"
+                      for key in values if fitted[key] != values[key]),
+        )
+        return fitted
+
+    def template(self, text: str):
+        """Instruction provider for an ADK-style template whose {state} values are budgeted."""
+
+        def instruction(context: ReadonlyContext) -> str:
+            values = {}
+            for key, optional in _PLACEHOLDER.findall(text):
+                if key in context.state:
+                    values[key] = context.state[key]
+                elif optional:
+                    values[key] = ""
+                else:
+                    raise KeyError(f"Context variable not found: `{key}`.")
+            values = self.fit(context.agent_name, values)
+            return _PLACEHOLDER.sub(lambda match: values[match.group(1)], text)
+
+        return instruction
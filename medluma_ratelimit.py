@@ -0,0 +1,186 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Process-wide Gemini rate limiting (requests and tokens per minute, per model)
+with jittered, deadline-aware retries
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from google.genai import errors, types
+from google.adk.models.google_llm import Gemini
+
+
+logger = logging.getLogger(__name__)
+
+# Per-model quotas (requests, tokens per minute); MEDLUMA_GEMINI_RPM / _TPM override them
+DEFAULT_MODEL_LIMITS = {
+    "gemini-2.5-pro": (150, 2_000_000),
+    "gemini-2.5-flash": (1_000, 1_000_000),
+    "gemini-2.5-flash-lite": (4_000, 4_000_000),
+}
+FALLBACK_LIMITS = (1_000, 1_000_000)
+
+RETRYABLE_STATUS_CODES = (429, 500, 503, 504)
+
+# Absolute deadline (time.monotonic()) of the user request being served, if any
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "medluma_request_deadline", default=None
+)
+
+# Status codes of the retries RateLimitedGemini makes, appended to the list a
+# caller (e.g. the tracing plugin) puts here before a model call
+model_retries: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    "medluma_model_retries", default=None
+)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Give every model call made inside the block a shared latency budget."""
+    token = request_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+class RateLimitExceeded(Exception):
+    """A model call could not be made within its latency budget."""
+
+
+class TokenBucket:
+    """Token bucket refilled at `per_minute`, holding at most one minute's worth.
+
+    `reserve()` takes tokens immediately (the balance may go negative) and
+    returns how long the caller must wait, so waiters are served in order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float):
+        """Return tokens (or, with a negative amount, charge more after the fact)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one model."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    async def acquire(self, estimated_tokens: int, deadline: float):
+        """Wait for capacity, or raise RateLimitExceeded if it would arrive after `deadline`."""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if time.monotonic() + wait > deadline:
+            self.requests.refund(1)
+            self.tokens.refund(estimated_tokens)
+            raise RateLimitExceeded(f"rate limit wait of {wait:.1f}s exceeds the latency budget")
+        if wait:
+            await asyncio.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(model: str) -> ModelRateLimiter:
+    """The process-wide limiter for `model`, shared by every agent using it.
+
+    MEDLUMA_RATE_LIMIT_SHARE scales the quotas down for processes that share
+    them (each of N pool workers gets 1/N).
+    """
+    with _limiters_lock:
+        if model not in _limiters:
+            rpm, tpm = DEFAULT_MODEL_LIMITS.get(model, FALLBACK_LIMITS)
+            share = float(os.environ.get("MEDLUMA_RATE_LIMIT_SHARE", "1"))
+            _limiters[model] = ModelRateLimiter(
+                rpm=float(os.environ.get("MEDLUMA_GEMINI_RPM", rpm)) * share,
+                tpm=float(os.environ.get("MEDLUMA_GEMINI_TPM", tpm)) * share,
+            )
+        return _limiters[model]
+
+
+def estimate_tokens(llm_request) -> int:
+    """Rough prompt + output token count (4 characters per token)."""
+    config = llm_request.config
+    chars = len(str(config.system_instruction or "")) if config else 0
+    for content in llm_request.contents or []:
+        for part in content.parts or []:
+            chars += len(part.text or "")
+            if part.function_call or part.function_response:
+                chars += len(str(part.function_call or part.function_response))
+    max_output = (config.max_output_tokens if config else None) or 1024
+    return chars // 4 + max_output
+
+
+class RateLimitedGemini(Gemini):
+    """Gemini behind the shared rate limiter, with its own retry policy.
+
+    Each call waits for its model's request and token buckets, then retries
+    429 / 5xx errors with full-jitter exponential backoff. It gives up when
+    the next attempt would start after the deadline: the enclosing
+    `deadline_scope`, or `latency_budget` seconds after the call began.
+    """
+
+    # The client's own HTTP retries are replaced by the loop below
+    retry_options: Optional[types.HttpRetryOptions] = types.HttpRetryOptions(attempts=1)
+    latency_budget: float = 120
+    max_attempts: int = 5
+    backoff_base: float = 1
+    backoff_cap: float = 20
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        deadline = time.monotonic() + self.latency_budget
+        if request_deadline.get() is not None:
+            deadline = min(deadline, request_deadline.get())
+        limiter = limiter_for(llm_request.model or self.model)
+        estimated = estimate_tokens(llm_request)
+
+        for attempt in range(self.max_attempts):
+            await limiter.acquire(estimated, deadline)
+            yielded = False
+            try:
+                async for response in super().generate_content_async(llm_request, stream):
+                    yielded = True
+                    usage = response.usage_metadata
+                    if usage and usage.total_token_count and not response.partial:
+                        limiter.tokens.refund(estimated - usage.total_token_count)
+                    yield response
+                return
+            except errors.APIError as e:
+                # Text already streamed to the client cannot be taken back
+                if yielded or e.code not in RETRYABLE_STATUS_CODES or attempt + 1 == self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning("%s returned %s; retrying in %.1fs", llm_request.model, e.code, delay)
+                if (retries := model_retries.get()) is not None:
+                    retries.append(e.code)
+                await asyncio.sleep(delay)
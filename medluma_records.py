@@ -0,0 +1,244 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Structured research records: the researchers emit typed JSON, state keeps it
+compact, and each downstream prompt renders only the fields it needs
+"""
+
+import json
+import logging
+import re
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
+
+from medluma_agents import normalize_preference
+from medluma_prompts import PromptBudget
+
+
+logger = logging.getLogger(__name__)
+
+
+# Record schema
+class Reference(BaseModel):
+    source: str = ""   # PMID, NCT id, DOI or URL
+    title: str = ""
+
+    def key(self) -> str:
+        return re.sub(r"\W+", "", (self.source or self.title).lower())
+
+
+class Trial(BaseModel):
+    id: str = ""
+    title: str = ""
+    phase: str = ""
+    recruiting: Optional[bool] = None
+
+
+class Mutation(BaseModel):
+    gene: str
+    variant: str = ""
+    significance: str = ""
+
+
+class Drug(BaseModel):
+    name: str
+    status: str = ""          # e.g. "FDA-approved", "awaiting approval", "investigational"
+    effectiveness: str = ""
+
+
+class Statistic(BaseModel):
+    name: str
+    value: str
+
+
+class Advance(BaseModel):
+    title: str
+    application: str = ""
+    timeline: str = ""
+
+
+class BioResearchRecord(BaseModel):
+    summary: str = ""
+    findings: list[str] = []
+    trials: list[Trial] = []
+    mutations: list[Mutation] = []
+    drugs: list[Drug] = []
+    statistics: list[Statistic] = []
+    references: list[Reference] = []
+
+
+class HealthResearchRecord(BaseModel):
+    advances: list[Advance] = []
+    references: list[Reference] = []
+
+
+# Output formats for the researchers' instructions
+BIO_RESEARCH_FORMAT = """Output ONLY a JSON object (no prose, no code fences) with these fields:
+    "summary": string (2-3 sentences),
+    "findings": [string],
+    "trials": [{"id": "NCT...", "title": string, "phase": string, "recruiting": true/false}],
+    "mutations": [{"gene": string, "variant": string, "significance": string}],
+    "drugs": [{"name": string, "status": "FDA-approved" | "awaiting approval" | "investigational", "effectiveness": string}],
+    "statistics": [{"name": string, "value": string}],
+    "references": [{"source": "PMID/NCT/DOI/URL", "title": string}]
+    Keep every string short; omit fields you found nothing for."""
+
+HEALTH_RESEARCH_FORMAT = """Output ONLY a JSON object (no prose, no code fences) with these fields:
+    "advances": [{"title": string, "application": string, "timeline": string}],
+    "references": [{"source": "URL or citation", "title": string}]
+    Keep every string short."""
+
+
+# Parsing and storage
+def parse_record(text, record_type):
+    """Parse model output (optionally fenced or wrapped in prose) into a record, or None."""
+    text = str(text or "")
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        return record_type.model_validate(json.loads(text[start:end + 1]))
+    except (json.JSONDecodeError, ValidationError):
+        return None
+
+
+def _structure(callback_context: CallbackContext, key: str, record_type):
+    record = parse_record(callback_context.state.get(key), record_type)
+    if record is None:
+        # Keep the free text; the renderers below pass it through unchanged
+        logger.warning("%s is not a valid %s; keeping free text", key, record_type.__name__)
+        return None
+    callback_context.state[key] = record.model_dump_json(exclude_defaults=True)
+    return None
+
+
+def structure_bio_research(callback_context: CallbackContext):
+    """Replace the raw `bio_research` output with its compact record."""
+    return _structure(callback_context, "bio_research", BioResearchRecord)
+
+
+def structure_health_research(callback_context: CallbackContext):
+    """Replace the raw `health_research` output with its compact record."""
+    return _structure(callback_context, "health_research", HealthResearchRecord)
+
+
+# Rendering
+def _trial_line(trial: Trial) -> str:
+    details = ", ".join(filter(None, [
+        trial.phase,
+        {True: "recruiting", False: "not recruiting"}.get(trial.recruiting, ""),
+    ]))
+    return f"{trial.id} {trial.title}".strip() + (f" ({details})" if details else "")
+
+
+def render_bio(value, fields=("summary", "findings", "trials", "mutations", "drugs", "statistics")) -> str:
+    """Render the requested fields of a bio research record as compact lines."""
+    record = parse_record(value, BioResearchRecord)
+    if record is None:
+        return str(value or "")
+    sections = {
+        "summary": [record.summary] if record.summary else [],
+        "findings": record.findings,
+        "trials": [_trial_line(trial) for trial in record.trials],
+        "mutations": [" ".join(filter(None, [m.gene, m.variant, f"({m.significance})" if m.significance else ""]))
+                      for m in record.mutations],
+        "drugs": [" - ".join(filter(None, [d.name, d.status, d.effectiveness])) for d in record.drugs],
+        "statistics": [f"{s.name}: {s.value}" for s in record.statistics],
+    }
+    lines = []
+    for field in fields:
+        if sections.get(field):
+            lines.append(f"{field.capitalize()}: " + "; ".join(sections[field]))
+    return "\n".join(lines)
+
+
+def render_advances(value) -> str:
+    """Render health research advances, one per line."""
+    record = parse_record(value, HealthResearchRecord)
+    if record is None:
+        return str(value or "")
+    return "\n".join(
+        "- " + " | ".join(filter(None, [a.title, a.application, a.timeline])) for a in record.advances
+    )
+
+
+def merge_references(*values) -> list[Reference]:
+    """References from every record, de-duplicated by source (or title)."""
+    merged = {}
+    for value in values:
+        record = parse_record(value, HealthResearchRecord)  # any record: only `references` is read
+        for reference in record.references if record else []:
+            merged.setdefault(reference.key(), reference)
+    return list(merged.values())
+
+
+def render_references(*values) -> str:
+    references = merge_references(*values)
+    if not references:
+        # Free-text research carries its references inline
+        return "(see the research text above)"
+    return "\n".join(
+        f"{i}. {ref.title} ({ref.source})" if ref.title and ref.source else f"{i}. {ref.title or ref.source}"
+        for i, ref in enumerate(references, 1)
+    )
+
+
+# Instruction providers
+def aggregator_instruction(budget: PromptBudget):
+    """Aggregator instruction provider; the rendered research is fitted to the agent's budget."""
+
+    def instruction(context: ReadonlyContext) -> str:
+        state = context.state
+        values = budget.fit(context.agent_name, {
+            "research": render_bio(state.get("bio_research")),
+            "news": render_advances(state.get("health_research")),
+            "references": render_references(state.get("bio_research"), state.get("health_research")),
+        })
+        return f"""Combine these findings into an executive summary:
+    **Research:**
+{values["research"]}
+    **News:**
+{values["news"]}
+    **References:**
+{values["references"]}
+    Highlight key takeaways (200 words) and cite the references."""
+
+    return instruction
+
+
+def final_output_instruction(budget: PromptBudget):
+    """Final output instruction provider; comprehensive output fits the research to the agent's budget."""
+
+    def instruction(context: ReadonlyContext) -> str:
+        state = context.state
+        if normalize_preference(state.get("user_preference")) == "simple":
+            # Passed through verbatim, so never compacted
+            return f"""Output this article as the final output, without changes:
+{state.get("current_science_article", "")}"""
+
+        values = budget.fit(context.agent_name, {
+            "research": render_bio(state.get("bio_research")),
+            "news": render_advances(state.get("health_research")),
+            "references": render_references(state.get("bio_research"), state.get("health_research")),
+        })
+        return f"""Create a final output from this research with the following sections:
+{values["research"]}
+
+    **BACKGROUND**
+    Provide context on the disease including definition, causes, risk factors and symptoms.
+
+    **SUMMARY**
+    Create a concise executive summary outlining key advances, their practical applications
+    (including treatment options), and estimated timelines.
+
+    **KEY DEVELOPMENTS**
+    2-3 points only, from:
+{values["news"]}
+
+    **REFERENCES**
+    List these references:
+{values["references"]}"""
+
+    return instruction
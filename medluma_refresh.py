@@ -0,0 +1,180 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Incremental refresh: fingerprint the research behind each final output and
+reuse the stored output when a rerun finds the same research
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from google.genai import types
+from google.adk.agents.callback_context import CallbackContext
+
+from medluma_agents import normalize_preference
+from medluma_cache import normalize_query
+from medluma_records import BioResearchRecord, HealthResearchRecord, parse_record
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_STORE = os.path.join(".medluma", "outputs.sqlite3")
+
+
+def research_fingerprint(bio_research, health_research) -> str:
+    """Hash of the facts in both research reports, ignoring how they are worded.
+
+    Structured records contribute their references, findings, statistics,
+    trials (id, phase, recruiting), drugs (name, status), mutations and
+    health advances, each normalized; two runs that report the same facts
+    match even if the model phrased its summary differently, while a new
+    finding or statistic behind the same citations does not. Free-text
+    research is hashed as normalized text.
+    """
+    facts = {}
+    bio = parse_record(bio_research, BioResearchRecord)
+    if bio is None:
+        facts["bio"] = normalize_query(str(bio_research or ""))
+    else:
+        facts["bio"] = {
+            "references": sorted({reference.key() for reference in bio.references}),
+            "findings": sorted({normalize_query(finding) for finding in bio.findings} - {""}),
+            "statistics": sorted({(normalize_query(s.name), normalize_query(s.value)) for s in bio.statistics}),
+            "trials": sorted({(normalize_query(t.id or t.title), normalize_query(t.phase), str(t.recruiting))
+                              for t in bio.trials}),
+            "drugs": sorted({(normalize_query(d.name), normalize_query(d.status)) for d in bio.drugs}),
+            "mutations": sorted({(normalize_query(m.gene), normalize_query(m.variant)) for m in bio.mutations}),
+        }
+    health = parse_record(health_research, HealthResearchRecord)
+    if health is None:
+        facts["health"] = normalize_query(str(health_research or ""))
+    else:
+        facts["health"] = {
+            "references": sorted({reference.key() for reference in health.references}),
+            "advances": sorted({(normalize_query(a.title), normalize_query(a.application), normalize_query(a.timeline))
+                                for a in health.advances}),
+        }
+    return hashlib.sha256(json.dumps(facts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class OutputStore:
+    """The last final output per (query, preference), with its research fingerprint.
+
+    Entries do not expire (a scheduled refresh compares against the last
+    run however old it is); beyond `max_entries` the least recently written
+    ones are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_OUTPUT_STORE, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS outputs (
+                key TEXT NOT NULL,
+                preference TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                final_output TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (key, preference)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outputs_updated ON outputs (updated_at)")
+
+    def get(self, query: str, preference: str):
+        """Return `{"fingerprint", "final_output", "updated_at"}` of the last run, or None."""
+        key = normalize_query(query)
+        if not key:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, final_output, updated_at FROM outputs WHERE key = ? AND preference = ?",
+                (key, preference),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"fingerprint": row[0], "final_output": row[1], "updated_at": row[2]}
+
+    def put(self, query: str, preference: str, fingerprint: str, final_output: str):
+        key = normalize_query(query)
+        if not key:
+            return
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO outputs (key, preference, fingerprint, final_output, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key, preference) DO UPDATE SET
+                    fingerprint = excluded.fingerprint,
+                    final_output = excluded.final_output,
+                    updated_at = excluded.updated_at""",
+                (key, preference, fingerprint, final_output, time.time()),
+            )
+            self._conn.execute(
+                """DELETE FROM outputs WHERE rowid IN (
+                    SELECT rowid FROM outputs ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _partial_research(state) -> bool:
+    return bool(state.get("bio_research_status") or state.get("health_research_status"))
+
+
+def reuse_unchanged_output(store: Optional[OutputStore]):
+    """Callback for the stage after research: skip it when the research matches the last run.
+
+    It records the fingerprint in state as `research_fingerprint`; on a match
+    it copies the stored final output into state and marks
+    `final_output_status` "unchanged".
+    """
+
+    def callback(callback_context: CallbackContext):
+        state = callback_context.state
+        if store is None or _partial_research(state) or "bio_research" not in state:
+            return None
+        fingerprint = research_fingerprint(state.get("bio_research"), state.get("health_research"))
+        state["research_fingerprint"] = fingerprint
+        preference = normalize_preference(state.get("user_preference"))
+        last = store.get(state.get("user_query", ""), preference)
+        if not last or last["fingerprint"] != fingerprint:
+            return None
+        logger.info("Research unchanged for %r (%s); reusing the stored output", state.get("user_query"), preference)
+        state["user_preference"] = preference
+        state["final_output"] = last["final_output"]
+        state["final_output_status"] = "unchanged"
+        return types.Content(role="model", parts=[types.Part(text=last["final_output"])])
+
+    return callback
+
+
+def store_output(store: Optional[OutputStore]):
+    """Callback for the root agent: remember a freshly written output and its research fingerprint."""
+
+    def callback(callback_context: CallbackContext):
+        state = callback_context.state
+        if store is None or not state.get("final_output") or state.get("final_output_status"):
+            return None
+        if _partial_research(state) or not state.get("research_fingerprint"):
+            return None
+        store.put(
+            state.get("user_query", ""),
+            normalize_preference(state.get("user_preference")),
+            state["research_fingerprint"],
+            state["final_output"],
+        )
+        return None
+
+    return callback
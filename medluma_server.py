@@ -0,0 +1,275 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Multi-tenant HTTP serving mode: admission control in front of `app` from
+medluma_app.py, streaming each run as Server-Sent Events
+
+Usage:
+    python medluma_server.py [--host 127.0.0.1] [--port 8080]
+
+    POST /runs                           {"user_id", "query", "session_id"?, "preference"?}
+    POST /runs/{session_id}/resume       {"user_id", "invocation_id", "approval_id", "reply"}
+    GET  /health
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import sys
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
+from google.genai import types
+from google.adk.runners import Runner
+
+import medluma_app
+from medluma_ratelimit import deadline_scope
+from medluma_sessions import DEFAULT_SESSION_DB, create_session_service, session_exists
+from medluma_stream import format_sse, resume_message, stream_run
+
+
+# Gemini calls one pipeline run makes, and how long it runs, on average
+MODEL_CALLS_PER_RUN = 8
+RUN_SECONDS = 60
+
+# Latency budget of one request; model calls stop retrying once it is spent
+REQUEST_LATENCY_BUDGET = float(os.environ.get("MEDLUMA_REQUEST_BUDGET", "600"))
+
+
+def in_flight_for_rpm(rpm: float, calls_per_run: float = MODEL_CALLS_PER_RUN,
+                      run_seconds: float = RUN_SECONDS) -> int:
+    """Concurrent runs that stay within a Gemini requests-per-minute quota (Little's law)."""
+    return max(1, math.floor(rpm / calls_per_run * run_seconds / 60))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded admission for pipeline runs.
+
+    At most `max_in_flight` runs execute at once; up to `max_queue` more
+    wait (for at most `queue_timeout` seconds) for a slot. Beyond that a run
+    is rejected immediately with 503, and a user with `per_user` runs
+    already running or queued is rejected with 429, so one client cannot
+    fill the queue. Users are keyed on the client-supplied `user_id`, so the
+    per-user limit is advisory; only the global limits bind a client that
+    varies it.
+    """
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 32, per_user: int = 2,
+                 queue_timeout: float = 30):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.per_user = per_user
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._users = Counter()
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = Counter()
+
+    async def acquire(self, user_id: str):
+        if self._users[user_id] >= self.per_user:
+            self.rejected["user_limit"] += 1
+            raise AdmissionRejected(429, f"at most {self.per_user} concurrent runs per user", retry_after=5)
+        # Counted here rather than via the semaphore, which only updates once a waiter runs
+        if self.in_flight + self.queued >= self.max_in_flight + self.max_queue:
+            self.rejected["saturated"] += 1
+            raise AdmissionRejected(503, "server is saturated", retry_after=max(1, int(self.queue_timeout)))
+
+        self._users[user_id] += 1
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._release_user(user_id)
+            self.rejected["queue_timeout"] += 1
+            raise AdmissionRejected(503, "timed out waiting for a slot", retry_after=max(1, int(self.queue_timeout)))
+        except BaseException:
+            self._release_user(user_id)
+            raise
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+
+    def release(self, user_id: str):
+        self.in_flight -= 1
+        self._slots.release()
+        self._release_user(user_id)
+
+    def _release_user(self, user_id: str):
+        self._users[user_id] -= 1
+        if self._users[user_id] <= 0:
+            del self._users[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "rejected": dict(self.rejected),
+        }
+
+
+class RunRequest(BaseModel):
+    user_id: str
+    query: str
+    session_id: Optional[str] = None
+    preference: Optional[str] = None
+
+
+class ResumeRequest(BaseModel):
+    user_id: str
+    invocation_id: str
+    approval_id: str
+    reply: str
+
+
+def _default_in_flight() -> int:
+    rpm = os.environ.get("MEDLUMA_GEMINI_RPM")
+    if rpm:
+        return in_flight_for_rpm(float(rpm))
+    return int(os.environ.get("MEDLUMA_MAX_IN_FLIGHT", "8"))
+
+
+def create_server(
+    admission: AdmissionController = None,
+    session_service=None,
+    app=None,
+    preload: bool = False,
+) -> FastAPI:
+    """Build the FastAPI app; defaults come from medluma_app and the environment.
+
+    The pipeline is built on the first run request (or at startup with
+    `preload`), so the server starts accepting health checks immediately.
+    """
+    admission = admission or AdmissionController(
+        max_in_flight=_default_in_flight(),
+        max_queue=int(os.environ.get("MEDLUMA_MAX_QUEUE", "32")),
+        per_user=int(os.environ.get("MEDLUMA_MAX_RUNS_PER_USER", "2")),
+        queue_timeout=float(os.environ.get("MEDLUMA_QUEUE_TIMEOUT", "30")),
+    )
+    session_service = session_service or create_session_service(
+        os.environ.get("MEDLUMA_SESSION_DB", DEFAULT_SESSION_DB),
+        paused_ttl=float(os.environ.get("MEDLUMA_PAUSED_SESSION_TTL", "3600")),
+    )
+    runner = None
+    runner_lock = asyncio.Lock()
+
+    async def get_runner() -> Runner:
+        nonlocal runner
+        if runner is None:
+            # Concurrent first requests wait for one build instead of each making a Runner
+            async with runner_lock:
+                if runner is None:
+                    # Importing the pipeline takes seconds; keep the event loop serving meanwhile
+                    runner = await asyncio.to_thread(
+                        lambda: Runner(app=app or medluma_app.app, session_service=session_service)
+                    )
+        return runner
+
+    @asynccontextmanager
+    async def lifespan(_):
+        if preload:
+            await get_runner()
+        try:
+            yield
+        finally:
+            if runner is not None:
+                await runner.close()
+            if "medluma_pipeline" in sys.modules:
+                await medluma_app.bio_mcp_pool.close()
+
+    server = FastAPI(title="Medluma", lifespan=lifespan)
+    server.state.admission = admission
+
+    async def admitted_stream(user_id: str, session_id: str, **run_kwargs) -> StreamingResponse:
+        # Admission happens before the response starts, so rejections are plain HTTP errors
+        try:
+            await admission.acquire(user_id)
+        except AdmissionRejected as e:
+            raise HTTPException(e.status_code, e.reason, headers={"Retry-After": str(e.retry_after)})
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                admission.release(user_id)
+
+        async def body():
+            try:
+                with deadline_scope(REQUEST_LATENCY_BUDGET):
+                    async for chunk in stream_run(await get_runner(), user_id=user_id, session_id=session_id, **run_kwargs):
+                        yield format_sse(chunk)
+            except Exception as e:
+                yield format_sse({"type": "error", "error": str(e)})
+            finally:
+                # A run paused on the preference question gives its slot back
+                release()
+
+        # The background task also releases the slot if the client leaves before the body starts
+        return StreamingResponse(body(), media_type="text/event-stream",
+                                 headers={"X-Session-Id": session_id}, background=BackgroundTask(release))
+
+    @server.post("/runs")
+    async def start_run(request: RunRequest):
+        session_id = request.session_id or uuid.uuid4().hex
+        app_name = (await get_runner()).app_name
+        if not await session_exists(session_service, app_name=app_name, user_id=request.user_id,
+                                    session_id=session_id):
+            await session_service.create_session(app_name=app_name, user_id=request.user_id,
+                                                 session_id=session_id)
+        return await admitted_stream(
+            request.user_id,
+            session_id,
+            new_message=types.Content(role="user", parts=[types.Part(text=request.query)]),
+            state_delta={"user_preference": request.preference} if request.preference else None,
+        )
+
+    @server.post("/runs/{session_id}/resume")
+    async def resume_run(session_id: str, request: ResumeRequest):
+        """Answer a paused run's "approval" chunk.
+
+        The chunk is sent while the paused invocation is still streaming its
+        research, so the resumed run waits until that invocation has
+        finished writing the session (see `stream_run`).
+        """
+        app_name = (await get_runner()).app_name
+        if not await session_exists(session_service, app_name=app_name, user_id=request.user_id,
+                                    session_id=session_id):
+            raise HTTPException(404, "unknown session")
+        return await admitted_stream(request.user_id, session_id,
+                                     new_message=resume_message(request.approval_id, request.reply),
+                                     invocation_id=request.invocation_id)
+
+    @server.get("/health")
+    async def health():
+        return {"status": "ok", "admission": admission.stats()}
+
+    return server
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve Medluma over HTTP with admission control.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--preload", action="store_true", help="Build the pipeline at startup, not on first request")
+    args = parser.parse_args()
+    uvicorn.run(create_server(preload=args.preload), host=args.host, port=args.port)
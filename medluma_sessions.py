@@ -0,0 +1,435 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Durable session store: compressed SQLite sessions with paused-session expiry
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_DB = os.path.join(".medluma", "sessions.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state BLOB NOT NULL,
+    create_time REAL NOT NULL,
+    update_time REAL NOT NULL,
+    paused_invocation_id TEXT,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE INDEX IF NOT EXISTS sessions_paused ON sessions (paused_invocation_id, update_time);
+CREATE TABLE IF NOT EXISTS events (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    invocation_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    event_data BLOB NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id, seq),
+    FOREIGN KEY (app_name, user_id, session_id)
+        REFERENCES sessions (app_name, user_id, id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS events_invocation ON events (invocation_id);
+CREATE TABLE IF NOT EXISTS state_deltas (
+    id INTEGER PRIMARY KEY,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    delta BLOB NOT NULL,
+    FOREIGN KEY (app_name, user_id, session_id)
+        REFERENCES sessions (app_name, user_id, id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS state_deltas_session ON state_deltas (app_name, user_id, session_id, id);
+"""
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value).encode("utf-8"))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob))
+
+
+def _split_state(state: Optional[dict]) -> tuple[dict, dict, dict]:
+    """Split a state (delta) into app, user and session scoped parts, dropping temp keys."""
+    app_state, user_state, session_state = {}, {}, {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app_state[key[len(State.APP_PREFIX):]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state[key[len(State.USER_PREFIX):]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state[key] = value
+    return app_state, user_state, session_state
+
+
+def _merge_state(app_state: dict, user_state: dict, session_state: dict) -> dict:
+    merged = copy.deepcopy(session_state)
+    merged.update({State.APP_PREFIX + key: value for key, value in app_state.items()})
+    merged.update({State.USER_PREFIX + key: value for key, value in user_state.items()})
+    return merged
+
+
+class SqliteSessionStore(BaseSessionService):
+    """ADK session service backed by a local SQLite file.
+
+    Events and session state are stored zlib-compressed; research state is
+    large and highly repetitive. An event appends only its state delta; the
+    deltas are folded into the stored state once `compact_every` of them have
+    piled up, so each event does not rewrite the whole state. Sessions paused
+    on a long-running tool call
+    (the output preference confirmation) are indexed by invocation id so any
+    worker sharing the file can resume them, and they are deleted once they
+    have waited longer than `paused_ttl` seconds.
+    """
+
+    def __init__(self, path: str = DEFAULT_SESSION_DB, paused_ttl: float = 3600, expire_interval: float = 60,
+                 compact_every: int = 32):
+        self.path = path
+        self.paused_ttl = paused_ttl
+        self.expire_interval = expire_interval
+        self.compact_every = compact_every
+        self._last_expiry = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    def _run(self, fn, *args):
+        """Run a blocking database call off the event loop, serialized by the lock."""
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return asyncio.to_thread(locked)
+
+    def _get_scoped_states(self, app_name: str, user_id: str) -> tuple[dict, dict]:
+        row = self._conn.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+        app_state = json.loads(row[0]) if row else {}
+        row = self._conn.execute(
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        ).fetchone()
+        user_state = json.loads(row[0]) if row else {}
+        return app_state, user_state
+
+    def _update_scoped_states(self, app_name: str, user_id: str, app_delta: dict, user_delta: dict):
+        app_state, user_state = self._get_scoped_states(app_name, user_id)
+        if app_delta:
+            app_state.update(app_delta)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)",
+                (app_name, json.dumps(app_state)),
+            )
+        if user_delta:
+            user_state.update(user_delta)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) VALUES (?, ?, ?)",
+                (app_name, user_id, json.dumps(user_state)),
+            )
+        return app_state, user_state
+
+    def _session_state(self, key: tuple, state: bytes) -> dict:
+        """The stored session state with its pending deltas applied."""
+        session_state = _unpack(state)
+        for (delta,) in self._conn.execute(
+            "SELECT delta FROM state_deltas WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY id", key
+        ):
+            session_state.update(_unpack(delta))
+        return session_state
+
+    def _compact_state(self, key: tuple):
+        """Fold the pending deltas into the stored session state."""
+        row = self._conn.execute(
+            "SELECT state FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key
+        ).fetchone()
+        self._conn.execute(
+            "UPDATE sessions SET state = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+            (_pack(self._session_state(key, row[0])), *key),
+        )
+        self._conn.execute("DELETE FROM state_deltas WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+
+    # Session service interface
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        if time.time() - self._last_expiry > self.expire_interval:
+            await self.expire_paused_sessions()
+        return await self._run(self._create_session, app_name, user_id, state, session_id)
+
+    def _create_session(self, app_name, user_id, state, session_id) -> Session:
+        now = time.time()
+        app_delta, user_delta, session_state = _split_state(state)
+        self._conn.execute("BEGIN")
+        try:
+            exists = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id),
+            ).fetchone()
+            if exists:
+                raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+            app_state, user_state = self._update_scoped_states(app_name, user_id, app_delta, user_delta)
+            self._conn.execute(
+                "INSERT INTO sessions (app_name, user_id, id, state, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?)",
+                (app_name, user_id, session_id, _pack(session_state), now, now),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=_merge_state(app_state, user_state, session_state),
+            events=[],
+            last_update_time=now,
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        return await self._run(self._get_session, app_name, user_id, session_id, config)
+
+    def _get_session(self, app_name, user_id, session_id, config) -> Optional[Session]:
+        row = self._conn.execute(
+            "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        ).fetchone()
+        if row is None:
+            return None
+        session_state, update_time = self._session_state((app_name, user_id, session_id), row[0]), row[1]
+
+        query = "SELECT event_data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?"
+        params = [app_name, user_id, session_id]
+        if config and config.after_timestamp:
+            query += " AND timestamp >= ?"
+            params.append(config.after_timestamp)
+        query += " ORDER BY seq DESC"
+        if config and config.num_recent_events:
+            query += " LIMIT ?"
+            params.append(config.num_recent_events)
+        rows = self._conn.execute(query, params).fetchall()
+        events = [Event.model_validate(_unpack(event_row[0])) for event_row in reversed(rows)]
+
+        app_state, user_state = self._get_scoped_states(app_name, user_id)
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=_merge_state(app_state, user_state, session_state),
+            events=events,
+            last_update_time=update_time,
+        )
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        return await self._run(self._list_sessions, app_name, user_id)
+
+    def _list_sessions(self, app_name, user_id) -> ListSessionsResponse:
+        query = "SELECT user_id, id, state, update_time FROM sessions WHERE app_name = ?"
+        params = [app_name]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        sessions = []
+        for row_user_id, session_id, state, update_time in self._conn.execute(query, params).fetchall():
+            app_state, user_state = self._get_scoped_states(app_name, row_user_id)
+            session_state = self._session_state((app_name, row_user_id, session_id), state)
+            sessions.append(Session(
+                app_name=app_name,
+                user_id=row_user_id,
+                id=session_id,
+                state=_merge_state(app_state, user_state, session_state),
+                events=[],
+                last_update_time=update_time,
+            ))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def session_exists(self, *, app_name: str, user_id: str, session_id: str) -> bool:
+        """Whether the session exists, without loading its state or events."""
+        return await self._run(self._session_exists, app_name, user_id, session_id)
+
+    def _session_exists(self, app_name, user_id, session_id) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        ).fetchone() is not None
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await self._run(self._delete_session, app_name, user_id, session_id)
+
+    def _delete_session(self, app_name, user_id, session_id):
+        self._conn.execute(
+            "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+            (app_name, user_id, session_id),
+        )
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        event = self._trim_temp_delta_state(event)
+        await self._run(self._append_event, session, event)
+        await super().append_event(session=session, event=event)
+        return event
+
+    def _append_event(self, session: Session, event: Event):
+        now = time.time()
+        key = (session.app_name, session.user_id, session.id)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT update_time, paused_invocation_id FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Session {session.id} not found.")
+            if row[0] > session.last_update_time:
+                raise ValueError(
+                    "The last_update_time provided in the session object is earlier than the "
+                    "update_time in storage. Please check if it is a stale session."
+                )
+
+            # Only the new delta is written; the stored state absorbs it at the next compaction
+            app_delta, user_delta, session_delta = _split_state(event.actions.state_delta)
+            if app_delta or user_delta:
+                self._update_scoped_states(session.app_name, session.user_id, app_delta, user_delta)
+            if session_delta:
+                self._conn.execute(
+                    "INSERT INTO state_deltas (app_name, user_id, session_id, delta) VALUES (?, ?, ?, ?)",
+                    (*key, _pack(session_delta)),
+                )
+                pending = self._conn.execute(
+                    "SELECT COUNT(*) FROM state_deltas WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+                ).fetchone()[0]
+                if pending >= self.compact_every:
+                    self._compact_state(key)
+
+            # A long-running tool call pauses the invocation until the user answers
+            if event.long_running_tool_ids:
+                paused_invocation_id = event.invocation_id
+            elif event.author == "user":
+                paused_invocation_id = None
+            else:
+                paused_invocation_id = row[1]
+
+            self._conn.execute(
+                """INSERT INTO events (app_name, user_id, session_id, seq, id, invocation_id, timestamp, event_data)
+                VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM events
+                                  WHERE app_name = ? AND user_id = ? AND session_id = ?), ?, ?, ?, ?)""",
+                (*key, *key, event.id, event.invocation_id, event.timestamp,
+                 _pack(event.model_dump(mode="json", exclude_none=True))),
+            )
+            self._conn.execute(
+                "UPDATE sessions SET update_time = ?, paused_invocation_id = ? "
+                "WHERE app_name = ? AND user_id = ? AND id = ?",
+                (now, paused_invocation_id, *key),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        session.last_update_time = now
+
+    # Resume and expiry
+    async def find_paused_session(self, invocation_id: str) -> Optional[tuple[str, str, str]]:
+        """Return (app_name, user_id, session_id) of the session paused on `invocation_id`."""
+        return await self._run(self._find_paused_session, invocation_id)
+
+    def _find_paused_session(self, invocation_id):
+        row = self._conn.execute(
+            "SELECT app_name, user_id, id FROM sessions WHERE paused_invocation_id = ?",
+            (invocation_id,),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    async def expire_paused_sessions(self) -> int:
+        """Delete sessions that have waited on the user for longer than `paused_ttl`."""
+        self._last_expiry = time.time()
+        return await self._run(self._expire_paused_sessions)
+
+    def _expire_paused_sessions(self) -> int:
+        deleted = self._conn.execute(
+            "DELETE FROM sessions WHERE paused_invocation_id IS NOT NULL AND update_time < ?",
+            (time.time() - self.paused_ttl,),
+        ).rowcount
+        if deleted:
+            logger.info("Expired %d abandoned paused sessions", deleted)
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+async def session_exists(session_service: BaseSessionService, *, app_name: str, user_id: str,
+                         session_id: str) -> bool:
+    """Whether a session exists, loading as little of it as the service allows."""
+    if isinstance(session_service, SqliteSessionStore):
+        return await session_service.session_exists(app_name=app_name, user_id=user_id, session_id=session_id)
+    # num_recent_events=0 means "all events" to ADK's services
+    session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id,
+                                                config=GetSessionConfig(num_recent_events=1))
+    return session is not None
+
+
+def create_session_service(uri: Optional[str] = None, paused_ttl: float = 3600) -> BaseSessionService:
+    """Build a session service from a URI.
+
+    "memory://" (or empty) keeps sessions in process memory, a plain path or
+    "medluma://<path>" uses SqliteSessionStore, and any other URL
+    (e.g. "postgresql://...") goes to ADK's DatabaseSessionService.
+    """
+    if not uri or uri == "memory://":
+        return InMemorySessionService()
+    parsed = urlparse(uri)
+    if parsed.scheme == "medluma":
+        return SqliteSessionStore(path=parsed.netloc + parsed.path, paused_ttl=paused_ttl)
+    if "://" in uri:
+        from google.adk.sessions.database_session_service import DatabaseSessionService
+        return DatabaseSessionService(db_url=uri)
+    return SqliteSessionStore(path=uri, paused_ttl=paused_ttl)
@@ -0,0 +1,103 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Streaming delivery: forward model text as it is generated, plus stage progress markers
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from google.genai import types
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.flows.llm_flows.functions import REQUEST_CONFIRMATION_FUNCTION_CALL_NAME
+
+from medluma_events import ProgressReporter, approval_request
+
+
+# Run config that makes every model call stream partial responses
+STREAMING_RUN_CONFIG = RunConfig(streaming_mode=StreamingMode.SSE)
+
+# Agents whose partial text is forwarded to the client
+STREAMED_AGENTS = ("FinalOutputAgent",)
+
+# (user id, session id) -> (lock, runs holding or waiting for it)
+_session_locks = {}
+
+
+@asynccontextmanager
+async def session_turn(user_id: str, session_id: str):
+    """Hold the session's lock, so runs of one session in this process take turns."""
+    key = (user_id, session_id)
+    lock, users = _session_locks.get(key, (None, 0))
+    _session_locks[key] = (lock or asyncio.Lock(), users + 1)
+    try:
+        async with _session_locks[key][0]:
+            yield
+    finally:
+        lock, users = _session_locks[key]
+        if users == 1:
+            del _session_locks[key]
+        else:
+            _session_locks[key] = (lock, users - 1)
+
+
+async def stream_run(runner, *, user_id: str, session_id: str, new_message=None,
+                     invocation_id: str = None, state_delta: dict = None,
+                     streamed_agents=STREAMED_AGENTS):
+    """Run the pipeline in SSE mode and yield client-facing chunks as they happen.
+
+    Chunks are dicts with a "type" of:
+      - "stage": the first event from an agent (progress marker)
+      - "text": a piece of model text from one of `streamed_agents`
+      - "approval": the run paused on `adk_request_confirmation` (see `approval_request`)
+      - "done": the run finished
+
+    The "approval" chunk arrives while the paused invocation is still
+    running its research, so a run on a session waits until the session's
+    previous run in this process has ended: a resume sent right away starts
+    once the paused invocation has finished writing the session.
+    """
+    stages = []
+    progress = ProgressReporter(lambda agent: stages.append({"type": "stage", "agent": agent}))
+    async with session_turn(user_id, session_id):
+        async for event in runner.run_async(
+            user_id=user_id,
+            session_id=session_id,
+            new_message=new_message,
+            invocation_id=invocation_id,
+            state_delta=state_delta,
+            run_config=STREAMING_RUN_CONFIG,
+        ):
+            progress(event)
+            while stages:
+                yield stages.pop(0)
+
+            approval = approval_request(event)
+            if approval:
+                yield {"type": "approval", **approval}
+
+            # Partial events carry the newly generated text; the final aggregated
+            # event repeats all of it, so only partials are forwarded. A cached
+            # answer arrives whole, from the callback that set `final_output`.
+            cached = (not event.partial and event.author not in streamed_agents
+                      and "final_output" in event.actions.state_delta)
+            if (event.partial and event.author in streamed_agents or cached) and event.content and event.content.parts:
+                text = "".join(part.text for part in event.content.parts if part.text and not part.thought)
+                if text:
+                    yield {"type": "text", "agent": event.author, "text": text}
+
+        yield {"type": "done"}
+
+
+def resume_message(approval_id: str, reply: str) -> types.Content:
+    """The message that answers an "approval" chunk and resumes the paused run."""
+    return types.Content(role="user", parts=[
+        types.Part(function_response=types.FunctionResponse(
+            id=approval_id, name=REQUEST_CONFIRMATION_FUNCTION_CALL_NAME, response={"confirmed": True})),
+        types.Part(text=reply),
+    ])
+
+
+def format_sse(chunk: dict) -> str:
+    """Encode a chunk from `stream_run` as a Server-Sent Events message."""
+    return f"event: {chunk['type']}\ndata: {json.dumps(chunk)}\n\n"
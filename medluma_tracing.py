@@ -0,0 +1,223 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Per-agent latency, token and tool-call tracing, with a p50/p95 summary report
+
+Usage:
+    python medluma_tracing.py report [traces.jsonl]
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from google.adk.plugins.base_plugin import BasePlugin
+from google.adk.tools.mcp_tool.mcp_tool import McpTool
+
+from medluma_ratelimit import model_retries
+
+
+DEFAULT_TRACE_FILE = os.path.join(".medluma", "traces.jsonl")
+
+
+class TracingPlugin(BasePlugin):
+    """Record one JSONL line per agent run, tool call and invocation.
+
+    Agent records carry start/end time, duration, input/output tokens, model
+    calls, model retries (429 / 5xx responses `RateLimitedGemini` retried)
+    and model errors (calls that still failed after those retries). Tool
+    records carry duration and whether the tool is an MCP tool.
+    """
+
+    def __init__(self, path: str = DEFAULT_TRACE_FILE):
+        super().__init__(name="medluma_tracing")
+        self.path = path
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._agents = {}
+        self._tools = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _write(self, record: dict):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def _close_agent(self, key, status: str):
+        span = self._agents.pop(key, None)
+        if span is None:
+            return
+        span["end"] = time.time()
+        span["duration"] = round(span["end"] - span["start"], 4)
+        span["status"] = status
+        self._write(span)
+
+    async def before_run_callback(self, *, invocation_context):
+        self._runs[invocation_context.invocation_id] = {
+            "type": "run",
+            "invocation_id": invocation_context.invocation_id,
+            "session_id": invocation_context.session.id,
+            "start": time.time(),
+        }
+        return None
+
+    async def after_run_callback(self, *, invocation_context):
+        invocation_id = invocation_context.invocation_id
+        # Agents skipped by a callback (e.g. a cache hit) never reach after_agent
+        for key in [key for key in self._agents if key[0] == invocation_id]:
+            self._close_agent(key, "incomplete")
+        run = self._runs.pop(invocation_id, None)
+        if run:
+            run["end"] = time.time()
+            run["duration"] = round(run["end"] - run["start"], 4)
+            self._write(run)
+
+    async def before_agent_callback(self, *, agent, callback_context):
+        self._agents[(callback_context.invocation_id, agent.name)] = {
+            "type": "agent",
+            "invocation_id": callback_context.invocation_id,
+            "session_id": callback_context._invocation_context.session.id,
+            "agent": agent.name,
+            "start": time.time(),
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "model_calls": 0,
+            "model_retries": 0,
+            "model_errors": 0,
+        }
+        return None
+
+    async def after_agent_callback(self, *, agent, callback_context):
+        self._close_agent((callback_context.invocation_id, agent.name), "ok")
+        return None
+
+    def _count_retries(self, span: dict):
+        retries = model_retries.get()
+        if retries:
+            span["model_retries"] += len(retries)
+            retries.clear()
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        # The model call runs in this context, so its retries land in this list
+        model_retries.set([])
+        return None
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        span = self._agents.get((callback_context.invocation_id, callback_context.agent_name))
+        if span is None or llm_response.partial:
+            return None
+        span["model_calls"] += 1
+        self._count_retries(span)
+        usage = llm_response.usage_metadata
+        if usage:
+            span["input_tokens"] += usage.prompt_token_count or 0
+            span["output_tokens"] += usage.candidates_token_count or 0
+        return None
+
+    async def on_model_error_callback(self, *, callback_context, llm_request, error):
+        span = self._agents.get((callback_context.invocation_id, callback_context.agent_name))
+        if span is not None:
+            span["model_errors"] += 1
+            self._count_retries(span)
+        return None
+
+    async def before_tool_callback(self, *, tool, tool_args, tool_context):
+        self._tools[tool_context.function_call_id] = time.time()
+        return None
+
+    def _record_tool(self, tool, tool_context, status: str):
+        start = self._tools.pop(tool_context.function_call_id, None)
+        if start is None:
+            return
+        end = time.time()
+        self._write({
+            "type": "tool",
+            "invocation_id": tool_context.invocation_id,
+            "session_id": tool_context._invocation_context.session.id,
+            "agent": tool_context.agent_name,
+            "tool": tool.name,
+            "mcp": isinstance(tool, McpTool),
+            "start": start,
+            "end": end,
+            "duration": round(end - start, 4),
+            "status": status,
+        })
+
+    async def after_tool_callback(self, *, tool, tool_args, tool_context, result):
+        self._record_tool(tool, tool_context, "ok")
+        return None
+
+    async def on_tool_error_callback(self, *, tool, tool_args, tool_context, error):
+        self._record_tool(tool, tool_context, "error")
+        return None
+
+
+# Summary report
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list.
+
+    >>> percentile([1, 2, 3, 4, 5], 50)
+    3
+    >>> percentile([1, 2, 3, 4, 5], 95)
+    5
+    >>> percentile([1, 2, 3, 4], 50)
+    2
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(path: str = DEFAULT_TRACE_FILE) -> list[dict]:
+    """Aggregate a trace file into per-stage latency and token statistics."""
+    stages = defaultdict(lambda: {"durations": [], "input_tokens": 0, "output_tokens": 0, "model_retries": 0,
+                                  "model_errors": 0})
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["type"] == "agent":
+                stage = record["agent"]
+            elif record["type"] == "tool":
+                stage = f"{'mcp' if record['mcp'] else 'tool'}:{record['tool']}"
+            else:
+                stage = "(request)"
+            stats = stages[stage]
+            stats["durations"].append(record["duration"])
+            stats["input_tokens"] += record.get("input_tokens", 0)
+            stats["output_tokens"] += record.get("output_tokens", 0)
+            stats["model_retries"] += record.get("model_retries", 0)
+            stats["model_errors"] += record.get("model_errors", 0)
+
+    rows = []
+    for stage, stats in stages.items():
+        durations = stats["durations"]
+        rows.append({
+            "stage": stage,
+            "count": len(durations),
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "avg_input_tokens": stats["input_tokens"] / len(durations),
+            "avg_output_tokens": stats["output_tokens"] / len(durations),
+            "model_retries": stats["model_retries"],
+            "model_errors": stats["model_errors"],
+        })
+    return sorted(rows, key=lambda row: row["p95"], reverse=True)
+
+
+def print_report(path: str = DEFAULT_TRACE_FILE):
+    print(f"{'stage':<40} {'count':>6} {'p50 s':>8} {'p95 s':>8} {'in tok':>8} {'out tok':>8} {'retries':>7} {'errors':>6}")
+    for row in summarize(path):
+        print(
+            f"{row['stage']:<40} {row['count']:>6} {row['p50']:>8.2f} {row['p95']:>8.2f} "
+            f"{row['avg_input_tokens']:>8.0f} {row['avg_output_tokens']:>8.0f} {row['model_retries']:>7} {row['model_errors']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "report":
+        print(__doc__.strip().splitlines()[-1].strip())
+        sys.exit(1)
+    print_report(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_TRACE_FILE)
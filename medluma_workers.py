@@ -0,0 +1,432 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Multi-process worker pool: sessions are sharded across worker processes, each
+with its own Runner, model clients and BioMCP servers, and a coordinator
+routes every resume back to the worker that paused the session
+
+Usage:
+    python medluma_workers.py queries.jsonl [--workers 4] [--output results.jsonl] [--concurrency 32]
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+
+from medluma_batch import load_batch_queries, load_completed_ids, record_label, result_record
+from medluma_cache import normalize_query
+
+
+logger = logging.getLogger(__name__)
+
+# "module:attribute" of the App each worker runs; the attribute may also be a
+# function that builds the App
+DEFAULT_APP = "medluma_app:app"
+
+# Latency budget of one run; model calls stop retrying once it is spent
+REQUEST_LATENCY_BUDGET = float(os.environ.get("MEDLUMA_REQUEST_BUDGET", "600"))
+
+
+def load_app(spec: str):
+    """Resolve "module:attribute" to (module, App)."""
+    module_name, _, attribute = spec.partition(":")
+    module = importlib.import_module(module_name)
+    app = getattr(module, attribute or "app")
+    return module, app() if callable(app) else app
+
+
+# Worker process
+def _worker_main(index: int, spec: str, jobs, results, rate_share: float):
+    # The Gemini quotas are per project, so the workers split them
+    os.environ["MEDLUMA_RATE_LIMIT_SHARE"] = str(rate_share)
+    try:
+        asyncio.run(_serve(index, spec, jobs, results))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve(index: int, spec: str, jobs, results):
+    from google.adk.runners import Runner
+    from medluma_sessions import DEFAULT_SESSION_DB, create_session_service
+
+    try:
+        module, app = load_app(spec)
+        session_service = create_session_service(
+            os.environ.get("MEDLUMA_SESSION_DB", DEFAULT_SESSION_DB),
+            paused_ttl=float(os.environ.get("MEDLUMA_PAUSED_SESSION_TTL", "3600")),
+        )
+        runner = Runner(app=app, session_service=session_service)
+        bio_mcp_pool = getattr(module, "bio_mcp_pool", None)
+        if bio_mcp_pool is not None:
+            await bio_mcp_pool.start()
+    except Exception as e:
+        results.put((None, {"type": "failed", "worker": index, "error": str(e)}))
+        raise
+    results.put((None, {"type": "ready", "worker": index}))
+
+    loop = asyncio.get_running_loop()
+    running = set()
+    try:
+        while True:
+            job = await loop.run_in_executor(None, jobs.get)
+            if job is None:
+                break
+            task = asyncio.create_task(_run_job(runner, session_service, job, results))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        await runner.close()
+        if bio_mcp_pool is not None:
+            await bio_mcp_pool.close()
+
+
+async def _run_job(runner, session_service, job: dict, results):
+    """Stream one run's chunks back to the coordinator, then an end marker (None)."""
+    from google.genai import types
+    from medluma_ratelimit import deadline_scope
+    from medluma_sessions import session_exists
+    from medluma_stream import resume_message, stream_run
+
+    job_id, user_id, session_id = job["job_id"], job["user_id"], job["session_id"]
+    app_name = runner.app_name
+    try:
+        if job["kind"] == "run":
+            if not await session_exists(session_service, app_name=app_name, user_id=user_id, session_id=session_id):
+                await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            run_kwargs = {
+                "new_message": types.Content(role="user", parts=[types.Part(text=job["query"])]),
+                "state_delta": {"user_preference": job["preference"]} if job.get("preference") else None,
+            }
+        else:
+            run_kwargs = {
+                "new_message": resume_message(job["approval_id"], job["reply"]),
+                "invocation_id": job["invocation_id"],
+            }
+
+        with deadline_scope(REQUEST_LATENCY_BUDGET):
+            async for chunk in stream_run(runner, user_id=user_id, session_id=session_id, **run_kwargs):
+                if chunk["type"] == "done":
+                    # Batch callers want the stored answer, not just the streamed text
+                    session = await session_service.get_session(app_name=app_name, user_id=user_id,
+                                                                session_id=session_id)
+                    state = session.state if session else {}
+                    chunk = {**chunk, "final_output": state.get("final_output"),
+                             "final_output_status": state.get("final_output_status")}
+                    if job.get("delete_session"):
+                        await session_service.delete_session(app_name=app_name, user_id=user_id,
+                                                             session_id=session_id)
+                results.put((job_id, chunk))
+    except Exception as e:
+        logger.exception("Run %s failed", job_id)
+        results.put((job_id, {"type": "error", "error": str(e)}))
+    finally:
+        results.put((job_id, None))
+
+
+# Coordinator
+class WorkerPool:
+    """Runs pipeline sessions on `workers` processes (default: one per core).
+
+    A new run goes to the worker already running the same normalized query,
+    so concurrent sessions share its research and output (see
+    `CoalescedAgent`), or else to the worker with the fewest runs in
+    progress. A run that pauses on the preference question stays on its
+    worker: `resume()` routes by the `invocation_id` of the "approval" chunk,
+    so the resumed run finds the Runner, session and BioMCP connections that
+    started it. Routes of runs not resumed within `paused_ttl` are dropped,
+    as the session store drops the sessions themselves. If a worker exits,
+    its sessions go to live workers, which load them from the shared session
+    store. Each worker gets 1/N of the Gemini rate limits.
+
+    Runs stream the same chunks as `medluma_stream.stream_run`; the "done"
+    chunk also carries `final_output` and `final_output_status`, and a
+    failed run ends with an "error" chunk.
+    """
+
+    def __init__(self, workers: int = None, app: str = DEFAULT_APP, paused_ttl: float = None,
+                 expire_interval: float = 60):
+        self.size = workers or os.cpu_count() or 1
+        self.app = app
+        # Routes of runs never resumed are dropped after the session store's TTL
+        self.paused_ttl = (paused_ttl if paused_ttl is not None
+                           else float(os.environ.get("MEDLUMA_PAUSED_SESSION_TTL", "3600")))
+        self.expire_interval = expire_interval
+        self._last_expiry = 0.0
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = []
+        self._job_queues = []
+        self._results = None
+        self._reader = None
+        self._loop = None
+        self._ready = None
+        self._started = False
+        self._closing = False
+        self._dead = set()
+        self._streams = {}              # job id -> (worker, asyncio.Queue of chunks)
+        self._running = Counter()       # worker -> runs in progress
+        self._paused = {}               # invocation id -> (worker, session id, paused at)
+        self._session_workers = {}      # session id -> worker, while a run is in progress or paused
+        self._active_sessions = Counter()   # session id -> runs in progress
+        self._query_workers = {}        # normalized query -> worker, while a run of it is in progress
+        self._query_runs = Counter()    # normalized query -> runs in progress
+
+    async def start(self):
+        """Spawn the workers and wait until each has built its pipeline."""
+        if self._processes:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        self._results = self._context.Queue()
+        for index in range(self.size):
+            jobs = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, self.app, jobs, self._results, 1 / self.size),
+                name=f"medluma-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+            self._job_queues.append(jobs)
+        self._reader = threading.Thread(target=self._read_results, name="medluma-worker-results", daemon=True)
+        self._reader.start()
+
+        for _ in range(self.size):
+            message = await self._ready.get()
+            if message["type"] == "failed":
+                await self.close()
+                raise RuntimeError(f"worker {message['worker']} failed to start: {message['error']}")
+        self._started = True
+
+    def _read_results(self):
+        """Forward chunks from the workers to the coordinator's event loop."""
+        while True:
+            try:
+                job_id, chunk = self._results.get(timeout=1)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if job_id is None and chunk is None:
+                return
+            self._loop.call_soon_threadsafe(self._dispatch, job_id, chunk)
+
+    def _check_workers(self):
+        for index, process in enumerate(self._processes):
+            if not self._closing and index not in self._dead and not process.is_alive():
+                self._dead.add(index)
+                self._loop.call_soon_threadsafe(self._fail_worker, index, process.exitcode)
+
+    def _dispatch(self, job_id, chunk):
+        if job_id is None:
+            self._ready.put_nowait(chunk)
+        elif job_id in self._streams:
+            self._streams[job_id][1].put_nowait(chunk)
+
+    def _fail_worker(self, index: int, exitcode):
+        logger.error("Worker %d exited with code %s", index, exitcode)
+        if not self._started:
+            self._ready.put_nowait({"type": "failed", "worker": index, "error": f"exit code {exitcode}"})
+        for worker, stream in self._streams.values():
+            if worker == index:
+                stream.put_nowait({"type": "error", "error": f"worker {index} exited"})
+                stream.put_nowait(None)
+        self._paused = {invocation: entry for invocation, entry in self._paused.items() if entry[0] != index}
+        # Sessions live in the shared session store, so their next run can go to any live worker
+        self._session_workers = {session: worker for session, worker in self._session_workers.items()
+                                 if worker != index}
+
+    def _least_busy(self) -> int:
+        alive = [index for index in range(self.size) if index not in self._dead]
+        if not alive:
+            raise RuntimeError("no live workers")
+        return min(alive, key=lambda index: (self._running[index], index))
+
+    def _live(self, worker):
+        """`worker`, or None if it is unknown or has exited."""
+        return None if worker is None or worker in self._dead else worker
+
+    def _worker_for_query(self, key: str) -> int:
+        worker = self._query_workers.get(key)
+        if worker is None or worker in self._dead:
+            return self._least_busy()
+        return worker
+
+    async def _submit(self, worker: int, job: dict):
+        if worker in self._dead:
+            raise RuntimeError(f"worker {worker} exited")
+        job_id = uuid.uuid4().hex
+        stream = asyncio.Queue()
+        self._streams[job_id] = (worker, stream)
+        self._running[worker] += 1
+        try:
+            self._job_queues[worker].put({**job, "job_id": job_id})
+            while (chunk := await stream.get()) is not None:
+                if chunk["type"] == "approval":
+                    self._paused[chunk["invocation_id"]] = (worker, job["session_id"], time.monotonic())
+                yield chunk
+        finally:
+            del self._streams[job_id]
+            self._running[worker] -= 1
+
+    def _expire_paused(self):
+        """Forget routes of paused runs that were never resumed within `paused_ttl`."""
+        now = time.monotonic()
+        if now - self._last_expiry < self.expire_interval:
+            return
+        self._last_expiry = now
+        for invocation_id, (worker, session_id, paused_at) in list(self._paused.items()):
+            if now - paused_at > self.paused_ttl:
+                del self._paused[invocation_id]
+                if not self._active_sessions[session_id] and self._session_workers.get(session_id) == worker:
+                    del self._session_workers[session_id]
+
+    async def _stream(self, worker: int, job: dict):
+        session_id = job["session_id"]
+        self._expire_paused()
+        self._session_workers[session_id] = worker
+        self._active_sessions[session_id] += 1
+        paused = False
+        try:
+            async for chunk in self._submit(worker, job):
+                paused = paused or chunk["type"] == "approval"
+                yield chunk
+        finally:
+            self._active_sessions[session_id] -= 1
+            if not self._active_sessions[session_id]:
+                del self._active_sessions[session_id]
+            if not paused:
+                self._session_workers.pop(session_id, None)
+
+    async def run(self, user_id: str, session_id: str, query: str, preference: str = None,
+                  delete_session: bool = False):
+        """Start a run for `query`; yields its chunks."""
+        key = normalize_query(query)
+        worker = self._live(self._session_workers.get(session_id))
+        if worker is None:
+            worker = self._worker_for_query(key)
+        job = {"kind": "run", "user_id": user_id, "session_id": session_id, "query": query,
+               "preference": preference, "delete_session": delete_session}
+        self._query_workers[key] = worker
+        self._query_runs[key] += 1
+        try:
+            async for chunk in self._stream(worker, job):
+                yield chunk
+        finally:
+            self._query_runs[key] -= 1
+            if not self._query_runs[key]:
+                del self._query_runs[key]
+                self._query_workers.pop(key, None)
+
+    async def resume(self, user_id: str, session_id: str, invocation_id: str, approval_id: str, reply: str,
+                     delete_session: bool = False):
+        """Resume a paused run on the worker that owns it; yields its chunks.
+
+        If that worker has exited (or the route expired), any live worker
+        resumes it from the session store.
+        """
+        entry = self._paused.pop(invocation_id, None)
+        worker = self._live(entry[0] if entry else None)
+        if worker is None:
+            worker = self._live(self._session_workers.get(session_id))
+        if worker is None:
+            worker = self._least_busy()
+        job = {"kind": "resume", "user_id": user_id, "session_id": session_id, "invocation_id": invocation_id,
+               "approval_id": approval_id, "reply": reply, "delete_session": delete_session}
+        async for chunk in self._stream(worker, job):
+            yield chunk
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.size,
+            "alive": self.size - len(self._dead),
+            "running": {index: self._running[index] for index in range(self.size)},
+            "paused": len(self._paused),
+        }
+
+    async def close(self, timeout: float = 30):
+        """Let the workers finish their runs, then stop them."""
+        self._closing = True
+        for jobs in self._job_queues:
+            jobs.put(None)
+        for process in self._processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+        if self._reader is not None:
+            self._results.put((None, None))
+            await asyncio.to_thread(self._reader.join)
+        self._processes, self._job_queues, self._reader = [], [], None
+
+
+# Batch mode
+async def run_batch(pool: WorkerPool, input_path: str, output_path: str, concurrency: int,
+                    default_preference: str = "simple"):
+    """Like medluma.py --batch, with the queries spread over the pool's workers."""
+    queries = load_batch_queries(input_path, default_preference)
+    completed = load_completed_ids(output_path)
+    pending = [item for item in queries if item["id"] not in completed]
+    print(f"🔄 {len(pending)} queries to run on {pool.size} workers ({len(queries) - len(pending)} already done)")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    done = 0
+    started = time.time()
+
+    async def process(item):
+        nonlocal done
+        async with semaphore:
+            item_started = time.time()
+            last = {}
+            try:
+                async for chunk in pool.run("batch_user", f"batch_{uuid.uuid4().hex[:8]}", item["query"],
+                                            item["preference"], delete_session=True):
+                    if chunk["type"] in ("done", "error"):
+                        last = chunk
+            except Exception as e:
+                last = {"type": "error", "error": str(e)}
+            if last.get("type") == "error":
+                record = {**item, "status": "error", "error": last["error"]}
+            else:
+                record = result_record(item, last.get("final_output"), last.get("final_output_status"),
+                                       time.time() - item_started)
+        async with write_lock:
+            with open(output_path, "a", encoding="utf-8") as out:
+                out.write(json.dumps(record) + "\n")
+            done += 1
+            icon = "✅" if record["status"] == "ok" else "⚠️"
+            print(f"{icon} [{done}/{len(pending)}] {item['query']} ({record_label(record)})")
+
+    await asyncio.gather(*(process(item) for item in pending))
+    elapsed = time.time() - started
+    if pending:
+        print(f"🧮 {len(pending)} queries in {elapsed:.1f}s ({len(pending) / elapsed:.2f}/s)")
+
+
+async def _main(args):
+    pool = WorkerPool(workers=args.workers, app=args.app)
+    await pool.start()
+    try:
+        await run_batch(pool, args.queries, args.output, args.concurrency, args.preference)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Medluma batch queries on a pool of worker processes.")
+    parser.add_argument("queries", help="JSONL or CSV file of queries to process")
+    parser.add_argument("--output", default="medluma_batch_results.jsonl", help="JSONL file for batch results")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU core)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent sessions across all workers")
+    parser.add_argument("--preference", choices=["simple", "comprehensive"], default="simple",
+                        help="Preference for queries that do not set one")
+    parser.add_argument("--app", default=DEFAULT_APP, help='App each worker runs, as "module:attribute"')
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,19 @@
+"""
+Medluma - AI-powered Disease Information Portal
+Registers the durable session store with `adk web` / `adk api_server`:
+
+    adk web --session_service_uri medluma://.medluma/sessions.sqlite3
+"""
+
+import os
+
+from google.adk.cli.service_registry import get_service_registry
+
+from medluma_sessions import create_session_service
+
+
+def medluma_session_factory(uri: str, **kwargs):
+    return create_session_service(uri, paused_ttl=float(os.environ.get("MEDLUMA_PAUSED_SESSION_TTL", "3600")))
+
+
+get_service_registry().register_session_service("medluma", medluma_session_factory)